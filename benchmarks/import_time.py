@@ -0,0 +1,39 @@
+import os
+import statistics
+import subprocess
+import sys
+
+# Benchmark of the import time and memory (peak RSS) of the scraper and the analysis code
+# Every case runs in a fresh interpreter, run from anywhere: python benchmarks/import_time.py [repeats]
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+CASES = {'scraper (import classes)': 'import classes',
+         'extraction (import methods)': 'import methods',
+         'analysis (methods.get_cluster_model)': 'import methods; methods.get_cluster_model'}
+
+MEASURE = '''
+import resource, time
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+# Method that runs a statement in a fresh interpreter and returns the seconds it took and the peak RSS in MB
+def measure(statement):
+
+    output = subprocess.run([sys.executable, '-c', MEASURE.format(statement=statement)],
+                            cwd=SRC, capture_output=True, text=True, check=True).stdout
+    seconds, rss = output.split()
+
+    # ru_maxrss is in kilobytes on linux
+    return float(seconds), int(rss) / 1024
+
+if __name__ == '__main__':
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    for name, statement in CASES.items():
+        results = [measure(statement) for _ in range(repeats)]
+        seconds = statistics.median(result[0] for result in results)
+        rss = statistics.median(result[1] for result in results)
+        print(f'{name:<40} {seconds:.3f} s \t {rss:.0f} MB')
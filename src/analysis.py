@@ -0,0 +1,651 @@
+from collections import OrderedDict
+import copy
+
+import numpy as np
+import pandas as pd
+
+# sklearn, scipy and matplotlib are imported in the methods that use them, they take long to load
+
+##########################################################################################
+### Analysis
+
+# Method that returns the linkage matrix (as used by scipy) of a fitted hierarchical model
+def get_linkage_matrix(model):
+    
+    # The two stage model already has one, with the micro clusters as leaves
+    if isinstance(model, TwoStageClustering):
+        return model.linkage_matrix_
+
+    # create the counts of samples under each node, the leaves count 1
+    n_samples = len(model.labels_)
+    counts = [1] * n_samples
+    for left, right in model.children_.tolist():
+        counts.append(counts[left] + counts[right])
+
+    linkage_matrix = np.column_stack(
+        [model.children_, model.distances_, counts[n_samples:]]
+    ).astype(float)
+    
+    return linkage_matrix
+
+def plot_dendrogram(model, **kwargs):
+    from scipy.cluster.hierarchy import dendrogram
+
+    # Create linkage matrix and then plot the dendrogram
+    linkage_matrix = get_linkage_matrix(model)
+    
+    # Show the number of characters instead of the number of micro clusters
+    if isinstance(model, TwoStageClustering) and 'leaf_label_func' not in kwargs:
+        kwargs['leaf_label_func'] = model.get_leaf_label
+
+    # Plot the corresponding dendrogram
+    dendrogram(linkage_matrix, **kwargs)
+    
+# Method that compresses rows into micro clusters
+# Returns their centers, their sizes and the micro cluster of every row
+def get_micro_clusters(X, num_micro_clusters=500):
+    from sklearn.cluster import MiniBatchKMeans
+    
+    # Small enough to use every row as its own micro cluster
+    if len(X) <= num_micro_clusters:
+        return X.astype(np.float64), np.ones(len(X)), np.arange(len(X))
+    
+    model = MiniBatchKMeans(n_clusters=num_micro_clusters, batch_size=4096, n_init=3, random_state=0)
+    labels = model.fit_predict(X)
+    sizes = np.bincount(labels, minlength=num_micro_clusters).astype(np.float64)
+    
+    # Drop micro clusters that ended up empty
+    used = np.flatnonzero(sizes)
+    new_labels = np.full(num_micro_clusters, -1)
+    new_labels[used] = np.arange(len(used))
+    
+    return model.cluster_centers_[used], sizes[used], new_labels[labels]
+
+# Method that returns the ward linkage matrix of weighted points (e.g. micro clusters with their sizes)
+# The fourth column holds the number of points under a node, get_node_sizes gives their total weight
+# Starts from the ward distance between the weighted points and merges with the Lance-Williams update,
+# so for points of weight 1 it is the same as the normal ward linkage
+def get_weighted_ward_linkage(centers, sizes):
+    
+    num_points = len(centers)
+    sizes = np.asarray(sizes, dtype=np.float64).copy()
+    
+    # Squared ward distances: 2 * n_i * n_j / (n_i + n_j) * |c_i - c_j|^2
+    squared_norms = (centers ** 2).sum(axis=1)
+    squared_distances = np.maximum(squared_norms[:, None] + squared_norms[None, :] - 2 * centers @ centers.T, 0)
+    distances = 2 * np.outer(sizes, sizes) / (sizes[:, None] + sizes[None, :]) * squared_distances
+    np.fill_diagonal(distances, np.inf)
+    
+    # The counts in the linkage matrix are the number of points (not their weights), like scipy expects
+    points = np.ones(num_points)
+    cluster_ids = np.arange(num_points)
+    linkage_matrix = np.zeros((num_points - 1, 4))
+    
+    for step in range(num_points - 1):
+        i, j = divmod(int(np.argmin(distances)), num_points)
+        distance = distances[i, j]
+        
+        linkage_matrix[step] = [min(cluster_ids[i], cluster_ids[j]), max(cluster_ids[i], cluster_ids[j]), np.sqrt(distance), points[i] + points[j]]
+        
+        # Distance of every cluster to the merged cluster, which takes the place of i
+        with np.errstate(invalid='ignore'):
+            merged = ((sizes + sizes[i]) * distances[:, i] + (sizes + sizes[j]) * distances[:, j] - sizes * distance) / (sizes + sizes[i] + sizes[j])
+        distances[:, i] = merged
+        distances[i, :] = merged
+        distances[i, i] = np.inf
+        distances[:, j] = np.inf
+        distances[j, :] = np.inf
+        
+        sizes[i] += sizes[j]
+        points[i] += points[j]
+        cluster_ids[i] = num_points + step
+    
+    return linkage_matrix
+
+# Method that returns the total weight under every node of a linkage matrix, the points first
+def get_node_sizes(linkage_matrix, sizes):
+    
+    node_sizes = list(sizes)
+    for left, right in linkage_matrix[:, :2].astype(int).tolist():
+        node_sizes.append(node_sizes[left] + node_sizes[right])
+    
+    return node_sizes
+
+# Class that clusters in two stages, so it also works for a large number of characters:
+# first the rows are compressed into micro clusters, then those are clustered hierarchically (ward) with their sizes as weights
+# Can be used as the model in get_cluster_model and get_cluster_centers_and_observations_closest
+class TwoStageClustering:
+    
+    # Method that is called when the class is initialized
+    def __init__(self, n_clusters=2, num_micro_clusters=500):
+        self.n_clusters = n_clusters
+        self.num_micro_clusters = num_micro_clusters
+    
+    def fit(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        
+        self.micro_centers_, self.micro_sizes_, self.micro_labels_ = get_micro_clusters(X, self.num_micro_clusters)
+        self.linkage_matrix_ = get_weighted_ward_linkage(self.micro_centers_, self.micro_sizes_)
+        self.node_sizes_ = get_node_sizes(self.linkage_matrix_, self.micro_sizes_)
+        self.labels_ = self.get_labels(self.n_clusters)
+        
+        return self
+    
+    def fit_predict(self, X):
+        return self.fit(X).labels_
+    
+    # Method that labels a node of the dendrogram with the number of characters under it
+    def get_leaf_label(self, node):
+        return f'({int(self.node_sizes_[node])})'
+    
+    # Method that cuts the tree into a number of flat clusters and returns the cluster of every row
+    def get_labels(self, num_clusters):
+        from scipy.cluster.hierarchy import fcluster
+        
+        if len(self.micro_sizes_) <= num_clusters:
+            return self.micro_labels_
+        
+        micro_cluster_labels = fcluster(self.linkage_matrix_, t=num_clusters, criterion='maxclust') - 1
+        
+        return micro_cluster_labels[self.micro_labels_]
+    
+# Method that returns an encoded dataframe with regards to the prodigies
+def get_encoded_prodigy_df(char_list):
+    
+    # Get unique prodigies
+    unique_prodigies = set()
+    for char in char_list:
+        prodigies = char['prodigies']
+        for prodigy in prodigies:
+            unique_prodigies.add(prodigy)
+    
+    unique_prodigies = list(unique_prodigies)
+    
+    # Create basic dataframe
+    data = []
+    for char in char_list:
+        dict = {"Prodigies": char['prodigies']}
+        data.append(dict)
+        
+    df = pd.DataFrame(data)
+
+    # Create binary variables for each prodigy
+    for prodigy in unique_prodigies:
+        df[prodigy] = df['Prodigies'].apply(lambda x: int(prodigy in x))
+    
+    # Drop first column
+    df = df.iloc[: , 1:]
+    
+    return df
+
+# Method that returns an encoded dataframe with regards to a single feature except the talents
+def get_encoded_feature_df(char_list, feature):
+    
+    # Get unique features
+    unique_features = set()
+    for char in char_list:
+        features = char[feature]
+        
+        # Check if features is a list
+        if not isinstance(features, list):
+            # Wrap it in a list
+            features = [features]
+        
+        # Loop over the features
+        for instance in features:
+            unique_features.add(instance)
+
+    unique_features = list(unique_features)
+    
+    # Create basic dataframe
+    data = []
+    for char in char_list:
+        dict = {"features": char[feature]}
+        data.append(dict)
+        
+    df = pd.DataFrame(data)
+
+    # Create binary variables for each prodigy
+    for feature in unique_features:
+        df[feature] = df['features'].apply(lambda x: int(feature in x))
+    
+    # Drop first column
+    df = df.iloc[: , 1:]
+    
+    return df
+
+# Input list of characters, output dendogram, uses plot_dendrogram method from previous block
+# With a number of micro clusters the tree is built on micro clusters first, see TwoStageClustering
+def print_dendrogram(encoded_df, num_micro_clusters=None):
+    from sklearn.cluster import AgglomerativeClustering
+    from matplotlib import pyplot as plt
+
+    if num_micro_clusters:
+        model = TwoStageClustering(num_micro_clusters=num_micro_clusters)
+    else:
+        # setting distance_threshold=0 ensures we compute the full tree.
+        model = AgglomerativeClustering(distance_threshold=0, n_clusters=None)
+
+    model = model.fit(encoded_df.to_numpy())
+    plt.title("Hierarchical Clustering Dendrogram")
+    # plot the top three levels of the dendrogram
+    plot_dendrogram(model, truncate_mode="level", p=3)
+    plt.xlabel("Number of points in node (or index of point if no parenthesis).")
+    plt.show()
+    
+# Method that output the cluster model of the characters with regards to the prodigies
+# With a precomputed distance matrix (e.g. bitpack.pairwise_distances) the model is fitted on the distances instead
+def get_cluster_model(encoded_df, num_clusters, model = None, distances = None):
+    from sklearn.cluster import AgglomerativeClustering
+    
+    if distances is not None:
+        if model == None:
+            model = AgglomerativeClustering(n_clusters=num_clusters, metric='precomputed', linkage='average', compute_distances=True)
+        
+        return model.fit(distances)
+    
+    if model == None:
+        model = AgglomerativeClustering(n_clusters=num_clusters, compute_distances=True)
+
+    model = model.fit(encoded_df.to_numpy())
+    
+    return model
+
+# Method that returns encoded dataframe of class or generic talents
+def get_encoded_talents_df(char_list, type='class talents'):
+    
+    if not type in ['class talents', 'generic talents']:
+        print('Use \'class talents\' or \'generic talents\' for type') 
+        return None
+    
+    # First get unique trees and talents
+    unique_trees = set()
+    unique_talents = set()
+
+    for char in char_list:
+        
+        # Update unique trees
+        trees = set(char[type].keys())
+        unique_trees = unique_trees | trees # Take union
+        
+        # Update  unique talents
+        talents = list()
+        for tree in list(char[type].values()):
+            talents.extend(tree.keys())
+            
+        unique_talents = unique_talents | set(talents) # Take union
+    
+    # Create initial dataframe
+    column_names = list(unique_trees) + list(unique_talents)
+    start_data = np.zeros((len(char_list), len(column_names)))
+    df = pd.DataFrame(start_data,columns=column_names)
+    
+    # Update dataframe
+    for index, char in enumerate(char_list):
+        for tree_name, tree_dict in list(char[type].items()):
+            
+            df.at[index, tree_name] = 1
+            
+            for talent_name, talent_level in tree_dict.items():
+                df.at[index, talent_name] = talent_level
+    
+    return df
+
+# With a precomputed distance matrix (e.g. bitpack.pairwise_distances) the clustering uses those distances (average linkage),
+# and the closest observation of a cluster is its medoid: the member with the smallest total distance to the other members
+def get_cluster_centers_and_observations_closest(df, model=None, num_clusters=2, distances=None):
+    from sklearn.cluster import AgglomerativeClustering
+    from sklearn.metrics import pairwise_distances_argmin_min
+
+    if distances is not None:
+        if model == None:
+            model = AgglomerativeClustering(n_clusters=num_clusters, metric='precomputed', linkage='average')
+        cluster_labels = model.fit_predict(distances)
+    else:
+        if model == None:
+            model = AgglomerativeClustering(n_clusters=num_clusters)
+        cluster_labels = model.fit_predict(df)
+
+    # Calculate the cluster centers (means)
+    cluster_centers = [np.mean(df[cluster_labels == i], axis=0) for i in range(num_clusters)]
+
+    # Find the closest data point to each cluster center
+    closest_points = []
+    for i, cluster_center in enumerate(cluster_centers):
+        if distances is not None:
+            members = np.flatnonzero(cluster_labels == i)
+            closest_point_idx = members[np.argmin(distances[np.ix_(members, members)].sum(axis=1))]
+        else:
+            closest_point_idx = pairwise_distances_argmin_min([cluster_center], df)[0][0]
+        closest_points.append(df.iloc[closest_point_idx])
+
+    return cluster_centers, closest_points
+
+# Get dicionary that has all the trees and the corresponding skills, must be doable by looping over every character
+def get_tree_dictionary(char_list, type='class talents'):
+
+    trees_already_seen = set()
+
+    trees_dictionary = OrderedDict()
+
+    for char in char_list:
+        
+        for tree_name, talent_dict in char[type].items():
+            
+            if not tree_name in trees_already_seen:
+                talent_names = list(talent_dict.keys())
+                trees_dictionary[tree_name] = talent_names
+                trees_already_seen.add(tree_name)
+            
+    return trees_dictionary
+
+# Method that prints a character tree of a character
+def print_character_tree(char, tree_dict, type='class talents'):
+    
+    char_trees = char[type].keys()
+    
+    for tree in tree_dict.keys():
+        
+        if tree in char_trees:
+            print(tree)
+            
+            for talent, level in char[type][tree].items():
+                print(f'\t {talent}: {level}')
+                
+# Method that prints the talent trees of a pd.Series
+def print_talent_series(series, tree_dict):
+    
+    for tree, talents_list in tree_dict.items():   
+        
+        if series[tree] != 0:
+            print(tree)
+            
+            for talent in talents_list:
+                print(f'\t {talent}: {series[talent]}')
+
+# Method that can print a closest observation
+def print_closest_observation(charList, char_series, groups=None, names=None):
+    
+    # Look up columns in a set instead of the index
+    in_series = set(char_series.index)
+    
+    # With the groups and raw column names of a matrix.BlockMatrix, names are looked up by position in their own feature,
+    # e.g. the generic tree 'Skeleton' isn't mistaken for the race
+    if groups is not None and names is not None:
+        values = char_series.to_numpy()
+        positions = {}
+        for feature, (start, stop) in groups.items():
+            positions[feature] = {}
+            for position in range(start, stop):
+                positions[feature].setdefault(names[position], position)
+        
+        def get_value(feature, name):
+            position = positions.get(feature, {}).get(name)
+            return None if position is None else values[position]
+    else:
+        def get_value(feature, name):
+            return char_series[name] if name in in_series else None
+    
+    ## Race
+    races_in_list = charList.race_dict.keys()
+    
+    for race in races_in_list:
+        try:
+            value = get_value('race', race)
+            if value is not None and value != 0:
+                print(f"Race: {race}")
+        except Exception as e:
+            print(e)
+            
+    
+    ## Prodigies
+    prodigies_in_list = charList.prodigy_dict.keys()
+
+    prodigies = []
+    for prod in prodigies_in_list:
+        value = get_value('prodigies', prod)
+        if value is not None and value != 0:
+            prodigies.append(prod)
+    
+    print("Prodigies:")
+    for prodigy in prodigies:
+        print(f"\t{prodigy}")
+    
+    ## Class talents
+    print("Class talents:")
+    for tree, talents_list in charList.class_talents_dict.items():
+        
+        value = get_value('class talents', tree)
+        if value is None:
+            continue
+        
+        if value != 0:
+            print(f"\t{tree}")
+            for talent in talents_list:
+                print(f"\t \t {talent:<30}: \t {get_value('class talents', talent)}")
+    
+    
+    ## Generic talents # Need to remove redundant class trees
+    print("Generic talents:")
+    for tree, talents_list in charList.generic_talents_dict.items():
+        
+        value = get_value('generic talents', tree)
+        if value is None:
+            continue
+        
+        if value != 0:
+            print(f"\t{tree}")
+            for talent in talents_list:
+                print(f"\t \t {talent:<30}: \t {get_value('generic talents', talent)}")
+
+# Method that converts a mean to  a build          
+def get_converted_mean(charList, series):
+    
+    # Make a deep copy of the series
+    char_series = copy.deepcopy(series)
+    
+    ## Convert Race
+    races_in_list = charList.race_dict.keys()
+    races_in_series = [x for x in races_in_list if x in char_series.index]
+    races_sorted = sorted(races_in_series, key=lambda race: char_series[race], reverse=True)
+    races_sorted.extend(['Whitehooves', 'Yeti'])
+    
+    # Set tree value to 0 for all but the most important race
+    for race in races_in_series:
+        if race == races_sorted[0]:
+            char_series[race] = 1
+        else:
+            char_series[race] = 0
+    
+    # Set race talents to zero for all but the most important race     
+    for index in char_series.index:
+        if '/' in index and any(race in index for race in races_sorted[1:]):
+            char_series[index] = 0
+            for talent in charList.generic_talents_dict[index]:
+                char_series[talent] = 0
+    
+    ## Convert Prodigies
+    
+    prodigies_in_list = charList.prodigy_dict.keys()
+    prodigies_in_series = [x for x in prodigies_in_list if x in char_series.index]
+    prodigies_sorted = sorted(prodigies_in_series, key=lambda prod: char_series[prod], reverse=True)
+    
+    # Loop over the prodigies in the series
+    for prod in prodigies_in_series:
+        if prod in prodigies_sorted[:2]:
+            char_series[prod] = 1
+        else:
+            char_series[prod] = 0
+    
+    ## Convert class and generic talents
+    type_dict = {'class talents': charList.class_talents_dict.values(),
+            'generic talents': charList.generic_talents_dict.values()}
+    
+    for type in ['class talents', 'generic talents']:
+    
+        type_talents_total = list()
+        for talents in type_dict[type]:
+            type_talents_total.extend(talents)
+        
+        type_talents = [x for x in type_talents_total if x in char_series.index]
+        
+        # Back-up series
+        rounded_down = 0
+        rounded_down_dict = {}
+        
+        # Round talents down
+        for talent in type_talents:
+            
+            after_decimal = char_series[talent] % 1
+            char_series[talent] = np.floor(char_series[talent])
+            
+            rounded_down += after_decimal
+            rounded_down_dict[talent] = after_decimal
+        
+        # Sort class talents by how much has been rounded
+        type_talents_ordered = sorted(rounded_down_dict, key=rounded_down_dict.get, reverse=True)
+        
+        # Redistribute
+        for talent in type_talents_ordered:
+            
+            char_series[talent] += 1
+            
+            rounded_down -= rounded_down_dict[talent]
+            
+            if rounded_down < 1:
+                break
+        
+    return char_series
+
+# Method that precomputes where the races, prodigies and talents of a character list are in the columns of an encoded matrix
+# Every entry is an array of column positions, in the order of the dictionaries of the character list
+# With the groups of a matrix.BlockMatrix (feature -> range of columns) names are only looked up in the columns of their own feature,
+# and with its raw column names (names, e.g. 'Skeleton' for the renamed 'Skeleton talent') they are looked up by those
+def get_column_masks(charList, columns, groups=None, names=None):
+    
+    if names is not None:
+        if len(names) != len(columns):
+            raise Exception("The names and the columns are different lengths")
+        columns = names
+    
+    # First position of every column name, per feature if the groups are known
+    def get_positions(feature):
+        if groups is None:
+            start, stop = 0, len(columns)
+        elif feature in groups:
+            start, stop = groups[feature]
+        else:
+            return {}
+        
+        positions = {}
+        for position in range(start, stop):
+            positions.setdefault(columns[position], position)
+        return positions
+        
+    def find(names, positions):
+        found = OrderedDict()
+        for name in names:
+            if name in positions:
+                found[positions[name]] = True
+        return np.array(list(found), dtype=np.int64)
+    
+    masks = {'races': find(charList.race_dict.keys(), get_positions('race')),
+             'prodigies': find(charList.prodigy_dict.keys(), get_positions('prodigies'))}
+    
+    for type, type_dict in [('class talents', charList.class_talents_dict), ('generic talents', charList.generic_talents_dict)]:
+        masks[type] = find((talent for talents in type_dict.values() for talent in talents), get_positions(type))
+    
+    ## Race trees: generic trees like 'Race / Dwarf' that belong to a race
+    positions = get_positions('generic talents')
+    race_names = [columns[position] for position in masks['races']] + ['Whitehooves', 'Yeti']
+    race_trees = [tree for tree in charList.generic_talents_dict if '/' in tree and tree in positions]
+    
+    # Which race (row) a race tree (column) belongs to
+    masks['race tree races'] = np.array([[race in tree for tree in race_trees] for race in race_names], dtype=bool).reshape(len(race_names), len(race_trees))
+    
+    # The columns of a race tree and its talents
+    tree_columns = np.zeros((len(race_trees), len(columns)), dtype=bool)
+    for row, tree in enumerate(race_trees):
+        tree_columns[row, positions[tree]] = True
+        for talent in charList.generic_talents_dict[tree]:
+            if talent in positions:
+                tree_columns[row, positions[talent]] = True
+    masks['race tree columns'] = tree_columns
+    
+    return masks
+
+# Method that rounds talent levels down and gives the rounded off points back to the talents that lost the most
+# Works on all rows of values[:, talents] at once, like the loop in get_converted_mean
+def round_and_redistribute(values, talents):
+    
+    if len(talents) == 0:
+        return
+    
+    talent_values = values[:, talents]
+    after_decimal = np.mod(talent_values, 1)
+    floored = np.floor(talent_values)
+    
+    # Sort by how much has been rounded
+    order = np.argsort(-after_decimal, axis=1, kind='stable')
+    sorted_decimals = np.take_along_axis(after_decimal, order, axis=1)
+    
+    # What is left to redistribute after every talent gets its point back, subtracted one at a time like the loop
+    rounded_down = np.cumsum(after_decimal, axis=1)[:, -1:]
+    left = np.subtract.accumulate(np.concatenate([rounded_down, sorted_decimals], axis=1), axis=1)[:, 1:]
+    
+    # Every talent up to and including the first one after which less than 1 is left gets a point
+    below = left < 1
+    num_points = np.where(below.any(axis=1), below.argmax(axis=1) + 1, len(talents))
+    
+    points = np.zeros_like(floored)
+    ranks = np.arange(len(talents))[None, :]
+    np.put_along_axis(points, order, (ranks < num_points[:, None]).astype(floored.dtype), axis=1)
+    
+    values[:, talents] = floored + points
+
+# Method that converts all the means (a DataFrame with a row per cluster, or a list of Series) to builds at once
+# Gives the same builds as get_converted_mean for every row, returns a DataFrame with a row per cluster
+# For centers of a matrix.BlockMatrix pass its groups and columns (names), so renamed columns like 'Skeleton talent' are found
+def get_converted_means(charList, centers, masks=None, groups=None, names=None):
+    
+    if not isinstance(centers, pd.DataFrame):
+        centers = pd.DataFrame(list(centers))
+    
+    if masks is None:
+        masks = get_column_masks(charList, list(centers.columns), groups, names)
+    
+    values = centers.to_numpy(dtype=np.float64, copy=True)
+    rows = np.arange(len(values))
+    
+    ## Convert Race
+    races = masks['races']
+    num_races = len(races)
+    
+    # The most important race of every row, or 'Whitehooves' (right after the races) if there are no races
+    if num_races > 0:
+        top_race = np.argsort(-values[:, races], axis=1, kind='stable')[:, 0]
+        values[:, races] = 0
+        values[rows, races[top_race]] = 1
+    else:
+        top_race = np.zeros(len(values), dtype=np.int64)
+    
+    # Set race trees and their talents to zero for all but the most important race
+    other_races = np.ones((len(values), num_races + 2), dtype=bool)
+    other_races[rows, top_race] = False
+    other_race_trees = (other_races.astype(np.int64) @ masks['race tree races'].astype(np.int64)) > 0
+    zero_columns = (other_race_trees.astype(np.int64) @ masks['race tree columns'].astype(np.int64)) > 0
+    values[zero_columns] = 0
+    
+    ## Convert Prodigies
+    prodigies = masks['prodigies']
+    if len(prodigies) > 0:
+        top_prodigies = np.argsort(-values[:, prodigies], axis=1, kind='stable')[:, :2]
+        values[:, prodigies] = 0
+        for column in range(top_prodigies.shape[1]):
+            values[rows, prodigies[top_prodigies[:, column]]] = 1
+    
+    ## Convert class and generic talents
+    for type in ['class talents', 'generic talents']:
+        round_and_redistribute(values, masks[type])
+    
+    return pd.DataFrame(values, index=centers.index, columns=centers.columns)
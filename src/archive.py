@@ -0,0 +1,224 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+
+import extraction
+
+# zstandard is only needed for the archive, a scraper without an archive doesn't need it
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Class that represents an append-only archive of raw character sheets, so characters can be extracted again
+# (after a fix or a new field) without downloading them again
+#
+# <path> holds every sheet as its own zstd frame, one after the other, and <path>.index has a json line per sheet:
+#   {"url": ..., "offset": ..., "length": ..., "fetched": ...}
+# so a single sheet can be read without decompressing the others. A sheet that is stored again replaces the old one in the index
+class HtmlArchive:
+
+    # Method that is called when the class is initialized, mode is 'a' (read and append) or 'r' (read only)
+    def __init__(self, path, mode='a', level=10):
+
+        if zstandard is None:
+            raise Exception("The archive needs the zstandard package, install it with: pip install zstandard")
+
+        if mode not in ['a', 'r']:
+            raise Exception(f"{mode} is not a valid mode, choose from ['a', 'r']")
+
+        self.path = path
+        self.index_path = path + '.index'
+        self.mode = mode
+        self.entries = OrderedDict() # url -> (offset, length, fetched)
+
+        self.compressor = zstandard.ZstdCompressor(level=level)
+        self.decompressor = zstandard.ZstdDecompressor()
+
+        if os.path.exists(self.index_path):
+            self.load()
+        elif mode == 'r':
+            raise Exception(f"Archive {path} doesn't exist")
+
+        if mode == 'a':
+            self.file = open(path, 'a+b')
+            self.index_file = open(self.index_path, 'a', encoding='utf-8')
+        else:
+            self.file = open(path, 'rb')
+            self.index_file = None
+
+    # Method that reads the index, and cuts off what was partially written during a crash
+    def load(self):
+
+        good_bytes = 0
+        data_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        end = 0
+
+        with open(self.index_path, 'rb') as file:
+            for line in file:
+
+                # A line without a newline or with broken json was being written during a crash
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+
+                # The index line is only written after its frame, but check anyway
+                if entry['offset'] + entry['length'] > data_size:
+                    break
+
+                self.entries.pop(entry['url'], None)
+                self.entries[entry['url']] = (entry['offset'], entry['length'], entry['fetched'])
+                end = max(end, entry['offset'] + entry['length'])
+                good_bytes += len(line)
+
+        if self.mode == 'a':
+            if good_bytes < os.path.getsize(self.index_path):
+                print(f"Discarding a partially written entry at the end of {self.index_path}")
+                with open(self.index_path, 'r+b') as file:
+                    file.truncate(good_bytes)
+
+            # A frame without an index line can't be found, so it's cut off too
+            if end < data_size:
+                with open(self.path, 'r+b') as file:
+                    file.truncate(end)
+
+    # Method that stores a sheet
+    def put(self, url, html):
+
+        if self.mode != 'a':
+            raise Exception(f"Archive {self.path} is opened read only")
+
+        frame = self.compressor.compress(html.encode('utf-8'))
+
+        self.file.seek(0, os.SEEK_END)
+        offset = self.file.tell()
+        self.file.write(frame)
+        self.file.flush()
+
+        fetched = time.time()
+        self.index_file.write(json.dumps({'url': url, 'offset': offset, 'length': len(frame), 'fetched': fetched}) + '\n')
+        self.index_file.flush()
+
+        self.entries.pop(url, None)
+        self.entries[url] = (offset, len(frame), fetched)
+
+    # Method that returns the sheet of a url
+    def get(self, url):
+
+        if url not in self.entries:
+            raise KeyError(url)
+
+        offset, length, _ = self.entries[url]
+        return read_frame(self.file, offset, length, self.decompressor)
+
+    # Method that returns the urls in the archive, in the order they were stored
+    def urls(self):
+        return list(self.entries.keys())
+
+    # Method that yields (url, sheet) for every sheet in the archive
+    def items(self):
+        for url in self.urls():
+            yield url, self.get(url)
+
+    # Method that makes sure everything is on disk
+    def sync(self):
+        if self.mode == 'a':
+            for file in [self.file, self.index_file]:
+                file.flush()
+                os.fsync(file.fileno())
+
+    # Method that closes the archive
+    def close(self):
+        self.sync()
+        self.file.close()
+        if self.index_file is not None:
+            self.index_file.close()
+
+    def __contains__(self, url):
+        return url in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# Method that reads and decompresses a single frame
+def read_frame(file, offset, length, decompressor):
+
+    file.seek(offset)
+    return decompressor.decompress(file.read(length)).decode('utf-8')
+
+# Method that extracts the characters of a chunk of (url, offset, length), run by every worker process
+# Returns (url, character dictionary) per sheet, the character is None if it's filtered out and an error message if parsing failed
+def extract_chunk(args):
+
+    path, chunk = args
+    decompressor = zstandard.ZstdDecompressor()
+    results = list()
+
+    with open(path, 'rb') as file:
+        for url, offset, length in chunk:
+            try:
+                char = extraction.parse_character_sheet(read_frame(file, offset, length, decompressor), url)
+
+                # Filter out non-english characters, like the scraper does
+                if char['class talents'] == OrderedDict() or char['generic talents'] == OrderedDict():
+                    char = None
+
+                results.append((url, char, None))
+            except Exception as e:
+                results.append((url, None, str(e)))
+
+    return results
+
+# Method that extracts all the characters in an archive again, with a number of worker processes (all cores if None)
+# Every worker reads its own sheets from the archive, so only offsets and the extracted characters are sent between processes
+# Returns the characters and a dictionary of url -> error for the sheets that couldn't be parsed
+def extract_archive(path, processes=None, chunk_size=200):
+
+    with HtmlArchive(path, mode='r') as archive:
+        entries = [(url, offset, length) for url, (offset, length, _) in archive.entries.items()]
+
+    chunks = [(path, entries[start:start + chunk_size]) for start in range(0, len(entries), chunk_size)]
+
+    print(f'Extracting {len(entries)} characters from {path}...')
+
+    characters = list()
+    errors = OrderedDict()
+    with multiprocessing.Pool(processes) as pool:
+        for results in pool.imap(extract_chunk, chunks):
+            for url, char, error in results:
+                if error is not None:
+                    errors[url] = error
+                elif char is not None:
+                    characters.append(char)
+
+    print(f'Extracted {len(characters)} characters, {len(errors)} sheets could not be parsed')
+
+    return characters, errors
+
+# Extract an archive again from the command line: python archive.py <archive> <characters.json> [--processes n]
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extract all the characters in an archive of character sheets again')
+    parser.add_argument('archive')
+    parser.add_argument('output', help='json file to write the characters to')
+    parser.add_argument('--processes', type=int, help='number of worker processes, all cores by default')
+    args = parser.parse_args()
+
+    characters, errors = extract_archive(args.archive, args.processes)
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(characters, file)
+
+    for url, error in errors.items():
+        print(f'{url}: {error}')
@@ -0,0 +1,102 @@
+import numpy as np
+
+# Number of bits set in every possible byte, used when numpy has no bitwise_count (numpy < 2.0)
+BYTE_POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+# Roughly how many 64 bit words the pairwise kernels handle at once
+KERNEL_WORDS = 1 << 22
+
+# Method that returns the number of bits set in every 64 bit word
+def popcount(words):
+
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+
+    return BYTE_POPCOUNT[words.view(np.uint8)].reshape(words.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+# Method that packs a 0/1 matrix (rows x columns) into 64 bit words (rows x ceil(columns / 64))
+def pack_bits(bits):
+
+    packed = np.packbits(np.asarray(bits) != 0, axis=1, bitorder='little')
+
+    # Pad every row to a whole number of words
+    padding = (-packed.shape[1]) % 8
+    if padding:
+        packed = np.concatenate([packed, np.zeros((packed.shape[0], padding), dtype=np.uint8)], axis=1)
+
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+# Class that represents binary features packed as one bit per column, 64 columns per word
+class PackedMatrix:
+
+    # Method that is called when the class is initialized
+    def __init__(self, words, columns):
+        self.words = words
+        self.columns = columns
+        self.length = words.shape[0]
+        self.counts = popcount(words).sum(axis=1, dtype=np.int64) # number of bits set in every row
+
+    # Method that returns the bits as a 0/1 matrix again
+    def unpack(self):
+        bits = np.unpackbits(self.words.view(np.uint8), axis=1, bitorder='little')
+        return bits[:, :len(self.columns)]
+
+    def __len__(self):
+        return self.length
+
+# Method that packs the binary columns of a matrix.BlockMatrix (races, prodigies, inscriptions and trees)
+# Only the given features are packed, all of them if features is None
+def pack_block_matrix(block_matrix, features=None, chunk_size=10000):
+
+    if block_matrix.binary is None:
+        raise Exception("The matrix doesn't know which of its columns are binary")
+
+    selected = list()
+    for feature, (start, stop) in block_matrix.groups.items():
+        if features is None or feature in features:
+            selected.extend(column for column in range(start, stop) if block_matrix.binary[column])
+
+    # Pack in chunks, so a memory mapped matrix isn't loaded as a whole
+    words = [pack_bits(block_matrix.data[start:start + chunk_size, selected])
+             for start in range(0, len(block_matrix), chunk_size)]
+    words = np.concatenate(words) if words else np.zeros((0, (len(selected) + 63) // 64), dtype=np.uint64)
+
+    return PackedMatrix(words, [block_matrix.columns[column] for column in selected])
+
+# Method that yields the pairwise distances between rows of a and rows of b, a chunk of rows of a at a time
+# metric is 'hamming' (number of different bits) or 'jaccard' (1 - shared bits / bits in either)
+def iter_pairwise_distances(a, b, metric='jaccard'):
+
+    if metric not in ['hamming', 'jaccard']:
+        raise Exception(f"{metric} is not a valid metric, choose from ['hamming', 'jaccard']")
+
+    chunk_size = max(1, KERNEL_WORDS // max(1, b.words.shape[0] * b.words.shape[1]))
+
+    for start in range(0, len(a), chunk_size):
+        rows = a.words[start:start + chunk_size, None, :]
+
+        if metric == 'hamming':
+            yield start, popcount(rows ^ b.words[None, :, :]).sum(axis=2, dtype=np.int64).astype(np.float64)
+        else:
+            shared = popcount(rows & b.words[None, :, :]).sum(axis=2, dtype=np.int64)
+            union = a.counts[start:start + chunk_size, None] + b.counts[None, :] - shared
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                distances = 1 - shared / union
+
+            # Two empty rows are the same
+            distances[union == 0] = 0
+            yield start, distances
+
+# Method that returns the matrix of pairwise distances between the rows of a and the rows of b (or a itself)
+# Can be used as a precomputed metric, e.g. in methods.get_cluster_centers_and_observations_closest
+def pairwise_distances(a, b=None, metric='jaccard'):
+
+    if b is None:
+        b = a
+
+    distances = np.zeros((len(a), len(b)))
+    for start, chunk in iter_pairwise_distances(a, b, metric):
+        distances[start:start + len(chunk)] = chunk
+
+    return distances
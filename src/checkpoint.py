@@ -0,0 +1,145 @@
+import json
+import os
+from collections import OrderedDict
+
+# Class that represents an append-only journal of a scrape, so an interrupted scrape can be resumed
+#
+# Every line of the journal is a json record:
+#   {"type": "start", "filter_url": ...}               written once, when the journal is created
+#   {"type": "page", "page": n, "urls": [...]}         character urls discovered on listing page n
+#   {"type": "urls_complete"}                           url discovery has finished
+#   {"type": "character", "url": ..., "character": {}}  an extracted character
+#   {"type": "rejected", "url": ...}                    a character that was extracted but filtered out
+class CheckpointJournal:
+
+    # Method that is called when the class is initialized
+    def __init__(self, path, filter_url, resume=False):
+        self.path = path
+        self.filter_url = filter_url
+
+        # State that is rebuilt from the journal when resuming
+        self.urls = set()
+        self.next_page = 0
+        self.urls_complete = False
+        self.done = OrderedDict() # url -> character dictionary, or None if it was rejected
+
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+
+        if exists and not resume:
+            raise Exception(f"Journal {path} already exists, use resume=True to continue it or remove it")
+
+        if exists:
+            self.load()
+
+        self.file = open(path, 'a', encoding='utf-8')
+
+        if not exists:
+            self.write({'type': 'start', 'filter_url': filter_url})
+
+    # Method that rebuilds the state from the journal on disk
+    def load(self):
+
+        good_bytes = 0
+
+        with open(self.path, 'rb') as file:
+            for line in file:
+
+                # A line without a newline or with broken json was being written during a crash
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line, object_pairs_hook=OrderedDict)
+                except ValueError:
+                    break
+
+                self.apply(record)
+                good_bytes += len(line)
+
+        # Cut off the partially written tail, so new records start on a clean line
+        if good_bytes < os.path.getsize(self.path):
+            print(f"Discarding a partially written record at the end of {self.path}")
+            with open(self.path, 'r+b') as file:
+                file.truncate(good_bytes)
+
+        print(f"Resuming from journal: {len(self.urls)} urls found, {len(self.done)} characters done")
+
+    # Method that updates the state with a single record
+    def apply(self, record):
+
+        if record['type'] == 'start':
+            if record['filter_url'] != self.filter_url:
+                raise Exception(f"Journal {self.path} belongs to filter {record['filter_url']}, not {self.filter_url}")
+
+        elif record['type'] == 'page':
+            self.urls.update(record['urls'])
+            self.next_page = max(self.next_page, record['page'] + 1)
+
+        elif record['type'] == 'urls_complete':
+            self.urls_complete = True
+
+        elif record['type'] == 'character':
+            self.done[record['url']] = record['character']
+
+        elif record['type'] == 'rejected':
+            self.done[record['url']] = None
+
+    # Method that appends a record and makes sure it is on disk before returning
+    def write(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    # Method that records the character urls found on a listing page
+    def record_page(self, page_number, urls):
+        record = {'type': 'page', 'page': page_number, 'urls': sorted(urls)}
+        self.write(record)
+        self.apply(record)
+
+    # Method that records that all the character urls have been found
+    def record_urls_complete(self):
+        record = {'type': 'urls_complete'}
+        self.write(record)
+        self.apply(record)
+
+    # Method that records an extracted character
+    def record_character(self, url, char):
+        record = {'type': 'character', 'url': url, 'character': char}
+        self.write(record)
+        self.apply(record)
+
+    # Method that records a character that was filtered out, so it isn't extracted again
+    def record_rejected(self, url):
+        record = {'type': 'rejected', 'url': url}
+        self.write(record)
+        self.apply(record)
+
+    # Method that returns the characters that have been extracted so far
+    def get_characters(self):
+        return [char for char in self.done.values() if char is not None]
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# Method that yields the characters in a journal one at a time, without loading the whole journal
+# Useful together with matrix.encode_to_disk, e.g. lambda: checkpoint.iter_journal_characters(path)
+def iter_journal_characters(path):
+
+    with open(path, 'rb') as file:
+        for line in file:
+
+            # Stop at a partially written record
+            if not line.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(line, object_pairs_hook=OrderedDict)
+            except ValueError:
+                break
+
+            if record['type'] == 'character':
+                yield record['character']
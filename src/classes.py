@@ -2,15 +2,25 @@ from dataclasses import dataclass
 import methods
 from collections import OrderedDict
 import copy
-import pandas as pd
+import requests
 import filter_codes
+import checkpoint
+import cube
+import work_queue
+
+# matrix, query, bitpack and online need numpy and pandas, they are imported in the methods that use them,
+# so a scraper doesn't have to load them
 
 # Class that represents a list of characters [each character is a dictionary]
 class CharacterList:
     
     # Method that is called when the class is initialized
-    def __init__(self, char_list):
-        self.char_list = copy.deepcopy(char_list) if char_list else []
+    # With deep_copy=False the list shares the character dictionaries, e.g. for the subsets returned by query
+    def __init__(self, char_list, deep_copy=True):
+        if deep_copy:
+            self.char_list = copy.deepcopy(char_list) if char_list else []
+        else:
+            self.char_list = list(char_list) if char_list else []
         self.length = len(char_list) if char_list else 0
         self.features = list(char_list[0].keys()) if char_list else []
         self.current = 0
@@ -22,6 +32,8 @@ class CharacterList:
         self.class_talents_dict = {}
         self.generic_talents_dict = {}
         self.appearing_dict = {}
+        self.cube = None
+        self.index = None
         
         self.update_dicts()
     
@@ -34,38 +46,70 @@ class CharacterList:
         self.class_talents_dict = {}
         self.generic_talents_dict = {}
         
+        # The cube and the index are built again when they are needed
+        self.cube = None
+        self.index = None
+        
         # Loop over all characters and update the dictionaries
         for char in self.char_list:
+            self.add_to_dicts(char)
+    
+    # Method that updates the dictionaries with a single character
+    def add_to_dicts(self, char):
             
-            # Update the race dictionary
-            if not char['race'] in list(self.race_dict.keys()):
-                self.race_dict[char['race']] = 1
+        # Update the race dictionary
+        if not char['race'] in self.race_dict:
+            self.race_dict[char['race']] = 1
+        else:
+            self.race_dict[char['race']] += 1    
+        
+        # Update the prodigy dictionary
+        for prodigy in char['prodigies']:
+            if not prodigy in self.prodigy_dict:
+                self.prodigy_dict[prodigy] = 1
+            else:
+                self.prodigy_dict[prodigy] += 1
+        
+        # Update the inscription dictionary        
+        for inscription in char['inscriptions']:
+            if not inscription in self.inscription_dict:
+                self.inscription_dict[inscription] = 1
             else:
-                self.race_dict[char['race']] += 1    
+                self.inscription_dict[inscription] += 1
+
+        # Update the class talents dictionary
+        for tree, talents_dict in char['class talents'].items():
+            if not tree in self.class_talents_dict:
+                self.class_talents_dict[tree] = list(talents_dict.keys())
             
-            # Update the prodigy dictionary
-            for prodigy in char['prodigies']:
-                if not prodigy in list(self.prodigy_dict.keys()):
-                    self.prodigy_dict[prodigy] = 1
-                else:
-                    self.prodigy_dict[prodigy] += 1
+        # Update the generic talents dictionary
+        for tree, talents_dict in char['generic talents'].items():
+            if not tree in self.generic_talents_dict:
+                self.generic_talents_dict[tree] = list(talents_dict.keys())
+    
+    # Method that adds characters to the list, and updates the dictionaries and the cube without going over the whole list
+    def add_characters(self, char_list):
+        
+        for char in copy.deepcopy(char_list):
+            self.char_list.append(char)
+            self.add_to_dicts(char)
             
-            # Update the inscription dictionary        
-            for inscription in char['inscriptions']:
-                if not inscription in list(self.inscription_dict.keys()):
-                    self.inscription_dict[inscription] = 1
-                else:
-                    self.inscription_dict[inscription] += 1
-
-            # Update the class talents dictionary
-            for tree, talents_dict in char['class talents'].items():
-                if not tree in list(self.class_talents_dict.keys()):
-                    self.class_talents_dict[tree] = list(talents_dict.keys())
-                
-            # Update the generic talents dictionary
-            for tree, talents_dict in char['generic talents'].items():
-                if not tree in list(self.generic_talents_dict.keys()):
-                    self.generic_talents_dict[tree] = list(talents_dict.keys())
+            if self.cube is not None:
+                self.cube.add(char)
+        
+        self.length = len(self.char_list)
+        self.index = None
+        
+        if not self.features and self.char_list:
+            self.features = list(self.char_list[0].keys())
+    
+    # Method that returns the aggregation cube of the list, see cube.AggregationCube
+    def get_cube(self):
+        
+        if self.cube is None:
+            self.cube = cube.AggregationCube(self.char_list)
+            
+        return self.cube
     
     # Method that cleans the charachter list
     def clean_characters(self):
@@ -87,6 +131,24 @@ class CharacterList:
         self.char_list = characters_cleaned
         self.update_dicts()
     
+    # Method that returns the bitmap index of the list, see query.CharacterIndex
+    def get_index(self):
+        import query
+        
+        if self.index is None:
+            self.index = query.CharacterIndex(self.char_list)
+            
+        return self.index
+    
+    # Method that returns the characters that match all the given filters as a new list that shares the characters
+    # e.g. query(char_class='Wyrmic', min_level=30, prodigy=['Flexible Combat'], talents={'Fire Breath': 3})
+    # See query.CharacterIndex.get_bitmap for all the filters
+    def query(self, **filters):
+        
+        rows = self.get_index().query(**filters)
+        
+        return CharacterList([self.char_list[row] for row in rows], deep_copy=False)
+    
     # Method that prints a summary of the character list
     def print_summary(self, num=5):
         
@@ -130,33 +192,40 @@ class CharacterList:
         
         return df
         
-    def get_combined_encoded_df(self, features, weights = None):
+    # Method that returns the encoded features as a matrix.BlockMatrix: one allocation, a range of columns per feature,
+    # and the weights are only applied when the values are asked for
+    def get_block_matrix(self, features, weights = None):
+        import matrix
         
         # Check if features is a list
         if not isinstance(features, list):
             # Wrap in list
             features = [features]
-            
-        # Set standard weights of 1
-        if weights == None:
-            weights = [1] * len(features)
         
         # Check if features and weights are the same length
-        if len(features) != len(weights):
+        if weights != None and len(features) != len(weights):
             raise Exception("The features and weights are different lengths")
         
-        df = pd.DataFrame()
-        
-        # Loop over all features
-        for index, feature in enumerate(features):
-            
-            # Check if feature is valid
-            if not feature in features:
+        # Check if features are valid
+        for feature in features:
+            if not feature in self.features:
                 raise Exception(f"{feature} is not a valid feature, choose from {self.features}")
-            
-            df = pd.concat([df, weights[index]*self.get_encoded_feature_df(feature)], axis = 1)
         
-        return df
+        block_matrix = matrix.encode_to_memory(self.char_list, features, weights)
+        
+        for feature in features:
+            self.appearing_dict[feature] = block_matrix.get_group_columns(feature)
+        
+        return block_matrix
+        
+    def get_combined_encoded_df(self, features, weights = None):
+        return self.get_block_matrix(features, weights).to_df()
+    
+    # Method that encodes (a) feature(s) in chunks to a memory mapped matrix on disk, see matrix.EncodedMatrix
+    def get_encoded_matrix(self, features, path, chunk_size=10000):
+        import matrix
+        
+        return matrix.encode_to_disk(self.char_list, features, path, chunk_size)
     
     # Method that prints a character in the character list
     def print_character(self, index):
@@ -171,30 +240,87 @@ class CharacterList:
         print(f"Diff.: \t{char['difficulty']}")
         print(f"PD: \t{char['permadeath']}")
     
+    # Method that returns the pairwise distances between the characters for the binary columns of (a) feature(s)
+    # (races, prodigies, inscriptions and trees, talent levels are left out), using bit-packed rows, see bitpack
+    # Give the block matrix of the features if it's already there, so they aren't encoded again
+    def get_binary_distances(self, features, metric='jaccard', block_matrix=None):
+        import bitpack
+        
+        if block_matrix is None:
+            block_matrix = self.get_block_matrix(features)
+        
+        packed = bitpack.pack_block_matrix(block_matrix)
+        
+        return bitpack.pairwise_distances(packed, metric=metric)
+    
     # Method that returns cluster model for (a) feature(s)
-    def get_cluster_model(self, features, num_clusters, model=None, weights = None):
+    # With metric 'jaccard' or 'hamming' the model uses the distances between the binary columns, see get_binary_distances
+    def get_cluster_model(self, features, num_clusters, model=None, weights = None, metric = None):
+        
+        if metric:
+            return methods.get_cluster_model(None, num_clusters, model, self.get_binary_distances(features, metric))
         
         df = self.get_combined_encoded_df(features, weights)
         
         # Return model
         return methods.get_cluster_model(df, num_clusters, model)
         
+    # Method that returns a clustering of (a) feature(s) that can be updated with new characters, see online.OnlineClustering
+    # The characters of the list are the first batches, add new ones with update
+    def get_online_clustering(self, features, num_clusters, weights = None, batch_size = 1024):
+        import matrix
+        import online
+
+        # Check if features is a list
+        if not isinstance(features, list):
+            features = [features]
+
+        # Check if features are valid
+        for feature in features:
+            if not feature in self.features:
+                raise Exception(f"{feature} is not a valid feature, choose from {self.features}")
+
+        # Use the columns of the whole list, so later batches don't lose them
+        vocabulary, _, trees = matrix.get_vocabulary(self.char_list, features)
+
+        clustering = online.OnlineClustering(features, num_clusters, weights, vocabulary, trees, batch_size)
+        clustering.update_in_batches(self.char_list)
+
+        return clustering
+
     # Method that prints a dendrogram for feature(s)
-    def print_dendrogram(self, features, weights = None):
+    # Use a number of micro clusters for large lists, see methods.TwoStageClustering
+    def print_dendrogram(self, features, weights = None, num_micro_clusters = None):
         
         df = self.get_combined_encoded_df(features, weights)
             
         # Print dendrogram
-        methods.print_dendrogram(df)
+        methods.print_dendrogram(df, num_micro_clusters)
     
     # Method that returns cluster centers and closest observation for (a) feature(s) and number of clusters
-    def get_cluster_centers_and_closest_observations(self, features, num_clusters, weights = None, model=None):
+    # With metric 'jaccard' or 'hamming' the clusters come from the distances between the binary columns, see get_binary_distances
+    def get_cluster_centers_and_closest_observations(self, features, num_clusters, weights = None, model=None, metric = None):
         
-        df = self.get_combined_encoded_df(features, weights)
+        # Encode once, for the values and for the binary distances
+        block_matrix = self.get_block_matrix(features, weights)
+        df = block_matrix.to_df()
+        distances = self.get_binary_distances(features, metric, block_matrix) if metric else None
         
         # Return
-        return methods.get_cluster_centers_and_observations_closest(df=df, num_clusters = num_clusters, model=model)
+        return methods.get_cluster_centers_and_observations_closest(df=df, num_clusters = num_clusters, model=model, distances=distances)
     
+    # Method that splits the list by (a) field(s), e.g. ['class', 'version'], and returns the cluster builds of every part,
+    # analysed at the same time on a pool of processes, see partition.analyse_partitions
+    def analyse_partitions(self, fields, features, num_clusters, weights = None, metric = None, processes = None, min_size = None):
+        import partition
+
+        # Check if features are valid
+        for feature in (features if isinstance(features, list) else [features]):
+            if not feature in self.features:
+                raise Exception(f"{feature} is not a valid feature, choose from {self.features}")
+
+        return partition.analyse_partitions(self, fields, features, num_clusters, weights, metric, processes, min_size)
+
     def __eq__(self, other):
         if isinstance(other, CharacterList):
             return self.char_list == other.char_list
@@ -292,24 +418,72 @@ class CharFilter:
         return url
     
     # Method that extracts the filtered characters
-    def get_characters(self):
+    # If a journal path is given, progress is written to it as the scrape goes, and resume=True continues an earlier journal
+    # If an archive path is given, the raw character sheets are stored in it, see archive.HtmlArchive
+    def get_characters(self, journal_path=None, resume=False, archive_path=None):
         
         # Get url
         filtered_url = self.create_url()
         
-        # Get charachter links
-        char_urls = methods.get_all_character_urls(base_url = filtered_url, max_urls = self.max_urls)
+        journal = checkpoint.CheckpointJournal(journal_path, filtered_url, resume) if journal_path else None
         
-        # Extract characters
-        characters = list()
-        for url in char_urls:
-    
-            char = methods.get_character_dictionary(url)
-    
-            # Filter out non-english characters
-            if not char['class talents'] == OrderedDict() and not char['generic talents'] == OrderedDict():
-                characters.append(char)
+        # Keep the raw sheets, see archive.HtmlArchive
+        if archive_path:
+            import archive
+            html_archive = archive.HtmlArchive(archive_path)
+        else:
+            html_archive = None
+        
+        try:
+            # Get charachter links
+            char_urls = methods.get_all_character_urls(base_url = filtered_url, max_urls = self.max_urls, journal = journal)
+            
+            # Extract characters
+            characters = list()
+            for url in char_urls:
                 
+                # Skip characters that are already in the journal
+                if journal and url in journal.done:
+                    if journal.done[url] is not None:
+                        characters.append(journal.done[url])
+                    continue
+        
+                # A failed download isn't written to the journal, so resuming tries it again
+                try:
+                    char = methods.get_character_dictionary(url, html_archive)
+                except requests.RequestException as e:
+                    print(f'Could not download {url}, skipping it for now')
+                    print(e)
+                    continue
+        
+                # Filter out non-english characters
+                if not char['class talents'] == OrderedDict() and not char['generic talents'] == OrderedDict():
+                    characters.append(char)
+                    
+                    if journal:
+                        journal.record_character(url, char)
+                elif journal:
+                    journal.record_rejected(url)
+        finally:
+            if journal:
+                journal.close()
+            if html_archive is not None:
+                html_archive.close()
+                
+        return CharacterList(characters)
+    
+    # Method that extracts the filtered characters with several worker processes that share a queue on disk
+    # Running the same call again continues the queue, more workers (also on the command line, see work_queue) can join it
+    def get_characters_with_workers(self, queue_path, num_workers=4):
+        
+        queue = work_queue.SQLiteWorkQueue(queue_path)
+        try:
+            work_queue.seed(queue, self)
+            work_queue.run_sqlite_workers(queue_path, num_workers)
+            characters = queue.get_characters()
+        finally:
+            queue.close()
+        
         return CharacterList(characters)
     
         
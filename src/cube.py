@@ -0,0 +1,145 @@
+from collections import Counter
+
+# The dimensions of the cube, the level band is made from the level of a character
+DIMENSIONS = ['class', 'race', 'version', 'difficulty', 'permadeath', 'level band']
+
+# The measures that are counted in every cell
+MEASURES = ['prodigies', 'inscriptions', 'trees', 'talents']
+
+# Method that returns the level band of a level, e.g. '10-19' for level 14
+def get_level_band(level, band_size=10):
+    try:
+        start = (int(level) // band_size) * band_size
+    except (TypeError, ValueError):
+        return 'unknown'
+
+    return f'{start}-{start + band_size - 1}'
+
+# Class that holds pre-aggregated counts of characters for every combination of the dimensions
+#
+# Every cell (one value for every dimension) holds the number of characters and a Counter per measure:
+#   'prodigies', 'inscriptions': number of characters that took it
+#   'trees':                     number of characters that have the (class or generic) tree
+#   'talents':                   sum of the talent levels
+# and 'talent characters', the number of characters with at least a point in a talent, for the mean level of the talents
+# Slices are dictionaries of dimension -> value (or list of values), the other dimensions are rolled up
+class AggregationCube:
+
+    # Method that is called when the class is initialized
+    def __init__(self, char_list=None, band_size=10):
+        self.band_size = band_size
+        self.cells = {}
+        self.index = {dimension: {} for dimension in DIMENSIONS} # dimension -> value -> set of cells
+
+        if char_list:
+            self.add_characters(char_list)
+
+    # Method that returns the cell of a character
+    def get_cell(self, char):
+        return tuple(get_level_band(char.get('level'), self.band_size) if dimension == 'level band' else char.get(dimension)
+                     for dimension in DIMENSIONS)
+
+    # Method that adds a single character to the cube
+    def add(self, char):
+
+        key = self.get_cell(char)
+
+        if key not in self.cells:
+            self.cells[key] = {'characters': 0, 'talent characters': Counter(), **{measure: Counter() for measure in MEASURES}}
+            for dimension, value in zip(DIMENSIONS, key):
+                self.index[dimension].setdefault(value, set()).add(key)
+
+        cell = self.cells[key]
+        cell['characters'] += 1
+        cell['prodigies'].update(char['prodigies'])
+        cell['inscriptions'].update(char['inscriptions'])
+
+        for type in ['class talents', 'generic talents']:
+            for tree, talents_dict in char[type].items():
+                cell['trees'][tree] += 1
+                for talent, level in talents_dict.items():
+                    cell['talents'][talent] += level
+                    if level > 0:
+                        cell['talent characters'][talent] += 1
+
+    # Method that adds a list of characters to the cube
+    def add_characters(self, char_list):
+        for char in char_list:
+            self.add(char)
+
+    # Method that returns the cells in a slice
+    def get_cells(self, slice=None):
+
+        keys = None
+        for dimension, values in (slice or {}).items():
+
+            if dimension not in self.index:
+                raise Exception(f"{dimension} is not a valid dimension, choose from {DIMENSIONS}")
+
+            # Check if values is a list
+            if not isinstance(values, (list, set, tuple)):
+                values = [values]
+
+            # Union over the values of a dimension, intersection over the dimensions
+            dimension_keys = set()
+            for value in values:
+                dimension_keys |= self.index[dimension].get(value, set())
+
+            keys = dimension_keys if keys is None else keys & dimension_keys
+
+        if keys is None:
+            return list(self.cells.values())
+
+        return [self.cells[key] for key in keys]
+
+    # Method that returns the number of characters in a slice
+    def count(self, slice=None):
+        return sum(cell['characters'] for cell in self.get_cells(slice))
+
+    # Method that returns the counts of a measure in a slice
+    def query(self, measure, slice=None):
+
+        if measure not in MEASURES + ['talent characters']:
+            raise Exception(f"{measure} is not a valid measure, choose from {MEASURES}")
+
+        total = Counter()
+        for cell in self.get_cells(slice):
+            total.update(cell[measure])
+
+        return total
+
+    # Method that returns the counts of a measure per character in a slice (pick rates)
+    # For talents it's the mean level of the characters that put at least a point in the talent
+    def rates(self, measure, slice=None):
+
+        if measure == 'talents':
+            talent_characters = self.query('talent characters', slice)
+            return {name: level / talent_characters[name] for name, level in self.query(measure, slice).most_common()
+                    if talent_characters[name] > 0}
+
+        characters = self.count(slice)
+        if characters == 0:
+            return {}
+
+        return {name: count / characters for name, count in self.query(measure, slice).most_common()}
+
+    # Method that returns the counts of a measure in a slice for every value of a dimension
+    def group_by(self, dimension, measure, slice=None):
+
+        if dimension not in self.index:
+            raise Exception(f"{dimension} is not a valid dimension, choose from {DIMENSIONS}")
+
+        return {value: self.query(measure, {**(slice or {}), dimension: value}) for value in self.index[dimension]}
+
+    # Method that prints the most common entries of a measure in a slice
+    def print_top(self, measure, slice=None, num=5):
+
+        characters = self.count(slice)
+        if measure == 'talents':
+            talent_characters = self.query('talent characters', slice)
+        print(f'{measure} ({characters} characters): ')
+        for name, rate in list(self.rates(measure, slice).items())[:num]:
+            if measure == 'talents':
+                print(f'\t{name} (mean level {round(rate, 2)}, taken by {round(100*talent_characters[name]/characters, 1)}%)')
+            else:
+                print(f'\t{name} ({round(100*rate, 1)}%)')
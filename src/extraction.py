@@ -0,0 +1,418 @@
+import requests
+from  bs4 import BeautifulSoup
+from collections import OrderedDict
+from html import unescape
+import re
+
+################################################################################3
+### Extraction
+
+# Method that gets the character urls from a page
+def get_char_urls_from_page(page_url=None, soup=None):
+    
+    # Set up BeautifulSoup if isn't given
+    if not soup:
+        req = requests.get(page_url)
+        soup = BeautifulSoup(req.text, 'html.parser')
+    
+    # Extract the html elements that contain the urls
+    char_url_html_list = soup.find_all("tr", {"class": "even"}) + soup.find_all("tr", {"class": "odd"})
+    
+    # Loop over those elements to get the character page urls
+    char_url_list = set()
+    for url_html in char_url_html_list:
+        char_url_list.add("https://te4.org/" + url_html.find_all("a")[1].get("href"))
+        
+    # Return set
+    return char_url_list
+
+def empty_page(page_url=None, soup=None):
+    if not soup:
+        req = requests.get(page_url)
+        soup = BeautifulSoup(req.text, 'html.parser')
+        
+    check = soup.find("tr", {"class":"odd"})
+    if check is not None and check.text == 'No characters available. ':
+        return True
+    else:
+        return False
+
+# Patterns that read a listing page straight from its bytes
+LISTING_ROW_PATTERN = re.compile(rb'<tr\s[^>]*class\s*=\s*"(?:[^"]*\s)?(?:even|odd)(?:\s[^"]*)?"[^>]*>(.*?)</tr\s*>', re.DOTALL | re.IGNORECASE)
+LISTING_LINK_PATTERN = re.compile(rb'<a\b([^>]*)>', re.IGNORECASE)
+LISTING_HREF_PATTERN = re.compile(rb'\bhref\s*=\s*(?:"([^"]*)"|\'([^\']*)\')', re.IGNORECASE)
+EMPTY_LISTING_TEXT = b'No characters available.'
+
+# Method that reads the character urls and the empty page signal from the chunks of a listing page as they come in
+# Returns (urls, empty), or None if the markup isn't what it expects
+def get_listing_from_chunks(chunks):
+    
+    character_urls = set()
+    empty = False
+    rows = 0
+    buffer = b''
+    
+    for chunk in chunks:
+        buffer += chunk
+        end = None
+        
+        # Only complete rows match, an unfinished row stays in the buffer
+        for match in LISTING_ROW_PATTERN.finditer(buffer):
+            rows += 1
+            end = match.end()
+            row = match.group(1)
+            
+            links = LISTING_LINK_PATTERN.findall(row)
+            
+            # The second link of a row is the character page
+            if len(links) >= 2:
+                href = LISTING_HREF_PATTERN.search(links[1])
+                if href is None:
+                    return None
+                character_urls.add("https://te4.org/" + unescape((href.group(1) or href.group(2) or b'').decode('utf-8')))
+            elif EMPTY_LISTING_TEXT in row:
+                empty = True
+            else:
+                return None
+        
+        # Keep only what may still be part of a row
+        if end is not None:
+            buffer = buffer[end:]
+        else:
+            start = buffer.rfind(b'<tr')
+            buffer = buffer[start:] if start >= 0 else buffer[-16:]
+    
+    if rows == 0:
+        return None
+    
+    return (set() if empty else character_urls), empty
+
+# Method that gets the character urls of a listing page and whether it is empty
+# Reads the raw bytes as they stream in, and falls back to BeautifulSoup when the markup is unexpected
+def get_listing_page(page_url, session=requests):
+    
+    req = session.get(page_url, stream=True)
+    
+    chunks = list()
+    def record(iterator):
+        for chunk in iterator:
+            chunks.append(chunk)
+            yield chunk
+    
+    stream = record(req.iter_content(chunk_size=16384))
+    listing = get_listing_from_chunks(stream)
+    
+    if listing is None:
+        print(f'Unexpected markup on {page_url}, reading it with BeautifulSoup...')
+        
+        # Read the rest of the page (the stream can only be read once) and decode it the way requests does
+        for _ in stream:
+            pass
+        text = str(b''.join(chunks), req.encoding or 'utf-8', errors='replace')
+        soup = BeautifulSoup(text, "html.parser")
+        
+        if empty_page(soup=soup):
+            return set(), True
+        
+        listing = get_char_urls_from_page(soup=soup), False
+    
+    return listing
+
+# Method that returns all the character urls, up to a maximum
+def get_all_character_urls(base_url, max_urls = 100, journal = None):
+    print('Extracting character urls...')
+    
+    # Set up
+    character_urls = set()
+    page_number = 0
+    
+    # Continue where the journal stopped
+    if journal:
+        character_urls = set(journal.urls)
+        page_number = journal.next_page
+        
+        if journal.urls_complete:
+            print(f'All {len(character_urls)} character urls were already found')
+            return character_urls
+    
+    # Reuse the connection for all the pages
+    with requests.Session() as session:
+        
+        while len(character_urls) <= max_urls:
+            
+            print(f'Now at {len(character_urls)} characters. Extracting characters from page {page_number}...')
+            
+            # Make current page url, get the urls on it
+            page_url = f"{base_url}&page={page_number}"
+            
+            page_urls, empty = get_listing_page(page_url, session)
+            
+            # Break if the page is empty
+            if empty:
+                print(f"Page {page_number} is empty. Ending...")
+                break
+            
+            # Get the character urls from the current page
+            character_urls = character_urls | page_urls # Take union of the two sets
+            
+            if journal:
+                journal.record_page(page_number, page_urls)
+            
+            # Update the page number
+            page_number += 1
+    
+    if journal:
+        journal.record_urls_complete()
+        
+    return character_urls
+
+# Declarative description of the character sheet
+# Every table on the sheet is a section that is recognised by its title, and is read by the given kind of reader:
+#   'fields':   rows of label and value, the label is matched (case insensitive, without ':') to one of the given labels.
+#               The position of the row is only used when none of the labels is found, e.g. for sheets that aren't in english
+#   'table':    all rows of label and value
+#   'links':    the names in the tooltip cells
+#   'list':     the name of the list item in every row
+#   'trees':    talent trees with their talents and levels
+CHARACTER_SHEET_SCHEMA = {
+    'Character': ('fields', {'game': {'labels': ['Game'], 'position': 0},
+                             'mode': {'labels': ['Mode', 'Difficulty', 'Difficulty / Permadeath'], 'position': 3},
+                             'sex': {'labels': ['Sex'], 'position': 4},
+                             'race': {'labels': ['Race'], 'position': 5},
+                             'class': {'labels': ['Class'], 'position': 6},
+                             'level': {'labels': ['Level'], 'position': 7},
+                             'size': {'labels': ['Size'], 'position': 8}}),
+    'Primary Stats': ('table', 'stats'),
+    'Inscriptions': ('links', 'inscriptions'),
+    'Class Talents': ('trees', 'class talents'),
+    'Generic Talents': ('trees', 'generic talents'),
+    'Prodigies': ('list', 'prodigies'),
+}
+
+# Sections that have to be on the sheet, the others get an empty default
+REQUIRED_SECTIONS = ['Character', 'Primary Stats', 'Inscriptions', 'Class Talents', 'Generic Talents']
+
+# Method that compiles the schema into lookup tables, so a sheet can be read in a single pass
+def compile_schema(schema):
+    
+    compiled = {'titles': {}, 'words': {}, 'labels': {}, 'positions': {}}
+    
+    for title, (kind, target) in schema.items():
+        
+        # Titles of a single word may also appear in a longer title, like 'Inscriptions (3/5)'
+        if len(title.split(' ')) == 1:
+            compiled['words'][title] = title
+        compiled['titles'][title] = title
+        
+        if kind == 'fields':
+            compiled['labels'][title] = {label.lower(): field for field, spec in target.items() for label in spec['labels']}
+            compiled['positions'][title] = {spec['position']: field for field, spec in target.items()}
+    
+    return compiled
+
+COMPILED_SHEET_SCHEMA = compile_schema(CHARACTER_SHEET_SCHEMA)
+
+# Method that returns the section in the schema that belongs to a table title
+def match_section(title, compiled=COMPILED_SHEET_SCHEMA):
+    
+    title = title.strip()
+    
+    if title in compiled['titles']:
+        return compiled['titles'][title]
+    
+    for word in title.split(' '):
+        if word in compiled['words']:
+            return compiled['words'][word]
+    
+    return None
+
+# Method that returns the text of an element without the text of the tooltips (divs) inside it
+def get_text_without_tooltips(element):
+    
+    strings = list()
+    for string in element.strings:
+        
+        # Skip the string if there is a div between it and the element
+        parent = string.parent
+        while parent is not element and parent.name != 'div':
+            parent = parent.parent
+            
+        if parent is element:
+            strings.append(string)
+    
+    return ''.join(strings)
+
+# Method that reads the label and value of a row, returns None for rows that aren't label and value
+def get_label_and_value(row):
+    
+    cells = row.find_all('td')
+    if len(cells) < 2:
+        return None
+    
+    return cells[0].text, cells[1].text
+
+# Method that extracts the information from the generic and class talent tables
+# Rows with a list item are talents, the other rows start a new tree
+def get_trees(table):
+    
+    try:
+        talents = OrderedDict()
+        tree = None
+        
+        for line in table.find_all("tr"):
+            
+            talent_html = line.find('li')
+            
+            # A tree
+            if talent_html is None:
+                tree = line.find('td').text
+                continue
+            
+            # A talent in the current tree
+            if tree is None:
+                raise Exception('Found a talent before the first tree')
+            
+            level = line.find_all('td')[-1].text
+            talents.setdefault(tree, OrderedDict())[get_text_without_tooltips(talent_html)] = int(level[0])
+            
+        return talents
+    
+    except Exception as e:
+        print('Something went wrong extracting the skill tree (Probably a non-english character)')
+        print(e)
+        return OrderedDict()
+
+# Method that reads all the sections of a character sheet in a single pass over its tables
+def get_sheet_sections(soup, schema=CHARACTER_SHEET_SCHEMA, compiled=COMPILED_SHEET_SCHEMA):
+    
+    sections = {}
+    
+    for table in soup.find_all("div", {"class": "charsheet"}):
+        
+        title_html = table.find('h4')
+        if title_html is None:
+            continue
+        
+        title = match_section(title_html.text, compiled)
+        if title is None or title in sections:
+            continue
+        
+        kind, target = schema[title]
+        
+        if kind == 'fields':
+            labels = compiled['labels'][title]
+            positions = compiled['positions'][title]
+            
+            by_label = {}
+            by_position = {}
+            for position, row in enumerate(table.find_all('tr')):
+                label_and_value = get_label_and_value(row)
+                if label_and_value is None:
+                    continue
+                
+                label, value = label_and_value
+                label = label.strip().rstrip(':').strip().lower()
+                
+                if label in labels:
+                    by_label[labels[label]] = value
+                if position in positions:
+                    by_position[positions[position]] = value
+            
+            # Labels win over positions
+            sections[title] = {**by_position, **by_label}
+        
+        elif kind == 'table':
+            sections[title] = dict(label_and_value for label_and_value in map(get_label_and_value, table.find_all('tr')) if label_and_value)
+            
+        elif kind == 'links':
+            sections[title] = [get_text_without_tooltips(cell) for cell in table.find_all("td", {"class": "qtip-link"})]
+            
+        elif kind == 'list':
+            sections[title] = [get_text_without_tooltips(row.find('li')) for row in table.find_all('tr') if row.find('li')]
+            
+        elif kind == 'trees':
+            sections[title] = get_trees(table)
+    
+    return sections
+
+# Method that turns the html of a character sheet into a dictionary, raises an exception if the sheet can't be read
+def parse_character_sheet(html, char_url):
+    
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    ### Name of the character (and the creator)
+    full_name = soup.find("div", {"id": "title-container"}).text
+    
+    ### All the tables of the sheet
+    sections = get_sheet_sections(soup)
+    
+    for title in REQUIRED_SECTIONS:
+        if title not in sections:
+            raise Exception(f"The character sheet has no {title} table")
+    
+    fields = sections['Character']
+    
+    # Game & Version
+    game_text_split = fields['game'].split(' ')
+    version = list.pop(game_text_split)
+    game = ' '.join(game_text_split)
+    
+    # Difficulty and permadeath
+    mode_text_split = fields['mode'].split(' ')
+    difficulty = mode_text_split[0]
+    permadeath = mode_text_split[1]
+    
+    # English
+    size = fields['size']
+    if size in ['tiny', 'small', 'medium', 'big', 'huge', 'gargantuan']:
+        english = True
+    else: 
+        english = False
+        
+    char_dictionary = {'name': full_name,
+                    'race': fields['race'],
+                    'class': fields['class'],
+                    'sex': fields['sex'],
+                    'level': fields['level'],
+                    'size': size,
+                    'english': english,
+                    'stats': sections['Primary Stats'],
+                    'inscriptions': sections['Inscriptions'],
+                    'class talents': sections['Class Talents'],
+                    'generic talents': sections['Generic Talents'],
+                    'prodigies': sections.get('Prodigies', list()),
+                    'game': game,
+                    'version': version,
+                    'difficulty': difficulty,
+                    'permadeath': permadeath,
+                    'url': char_url}
+    
+    return char_dictionary
+
+# Method that puts the relevant data of a character in a dictionary
+# With an archive (archive.HtmlArchive) the sheet is stored as well, so it can be extracted again later without downloading it
+# A failed download that may work later (connection error, timeout or a server error) raises a requests.RequestException,
+# so the character can be tried again; a page that isn't there (e.g. a deleted character, 404) or a sheet that can't be parsed
+# gives a dictionary without talents, like a rejected character
+def get_character_dictionary(char_url, archive=None):
+    
+    print(f'Beginning to extract {char_url}...')
+    
+    req = requests.get(char_url)
+    
+    if 400 <= req.status_code < 500:
+        print(f'The character is not available ({req.status_code})')
+        return {'class talents': OrderedDict(), 'generic talents': OrderedDict()}
+    
+    req.raise_for_status()
+    
+    if archive is not None:
+        archive.put(char_url, req.text)
+    
+    try:
+        return parse_character_sheet(req.text, char_url)
+    
+    except Exception as e:
+        print('Something went wrong with this character')
+        print(e)
+        return {'class talents': OrderedDict(), 'generic talents': OrderedDict()}
@@ -0,0 +1,358 @@
+import json
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# sklearn is imported in the methods that use it, it takes long to load
+
+TALENT_FEATURES = ['class talents', 'generic talents']
+
+# Class that represents an encoded matrix made of blocks of columns, one block per feature
+# The schema (groups) maps every feature to its range of columns, the data is stored once in a compact dtype,
+# and the weight of every feature is only applied when weighted values are asked for
+class BlockMatrix:
+
+    # Method that is called when the class is initialized
+    def __init__(self, data, columns, groups, weights=None, binary=None):
+        self.data = data
+        self.columns = columns
+        self.groups = OrderedDict(groups) # feature -> (first column, column after the last)
+        self.binary = binary # for every column whether it only holds 0 or 1 (everything except talent levels)
+        self.shape = data.shape
+        self.length = data.shape[0]
+        self.weights = weights
+
+    # Method that returns the weight of every column, from a weight per feature
+    def get_column_weights(self, weights=None):
+
+        if weights is None:
+            weights = self.weights
+
+        if weights is None:
+            weights = [1] * len(self.groups)
+
+        if len(weights) != len(self.groups):
+            raise Exception("The features and weights are different lengths")
+
+        column_weights = np.ones(self.shape[1], dtype=np.float32)
+        for (start, stop), weight in zip(self.groups.values(), weights):
+            column_weights[start:stop] = weight
+
+        return column_weights
+
+    # Method that returns the (unweighted) columns of a feature, without copying
+    def get_group(self, feature):
+
+        if feature not in self.groups:
+            raise Exception(f"{feature} is not in the matrix, choose from {list(self.groups.keys())}")
+
+        start, stop = self.groups[feature]
+        return self.data[:, start:stop]
+
+    # Method that returns the column names of a feature
+    def get_group_columns(self, feature):
+        start, stop = self.groups[feature]
+        return self.columns[start:stop]
+
+    # Method that returns the weighted values as a float array
+    def to_numpy(self, weights=None):
+        return self.data * self.get_column_weights(weights)
+
+    # Method that returns column names that are unique over the features
+    # A talent or tree with the name of a race (or another value) always gets the suffix ' talent', like 'Skeleton talent'
+    # for the generic tree 'Skeleton', whatever the order of the features, so races etc. keep their plain names.
+    # Any other name that is already used by an earlier feature gets the feature as suffix, e.g. 'Name (feature)'
+    def get_unique_columns(self):
+
+        # The names of the features that aren't talents
+        plain = set()
+        for feature, (start, stop) in self.groups.items():
+            if feature not in TALENT_FEATURES:
+                plain.update(self.columns[start:stop])
+
+        used = set()
+        unique_columns = list()
+        for feature, (start, stop) in self.groups.items():
+            for column in self.columns[start:stop]:
+                if feature in TALENT_FEATURES and column in plain:
+                    column = column + ' talent'
+                if column in used:
+                    column = column + f' ({feature})'
+                used.add(column)
+                unique_columns.append(column)
+
+        return unique_columns
+
+    # Method that returns the weighted values as a pandas DataFrame
+    def to_df(self, weights=None):
+        return pd.DataFrame(self.to_numpy(weights), columns=self.get_unique_columns(), copy=False)
+
+    # Method that yields (first row, weighted float block) for consecutive chunks of rows
+    def iter_chunks(self, chunk_size=10000, weights=None):
+
+        column_weights = self.get_column_weights(weights)
+
+        for start in range(0, self.length, chunk_size):
+            yield start, self.data[start:start + chunk_size].astype(np.float32) * column_weights
+
+    # Method that returns a single row as a pandas Series, with the unique column names (see get_unique_columns)
+    def get_row(self, index, weights=None):
+        return pd.Series(self.data[index].astype(np.float32) * self.get_column_weights(weights), index=self.get_unique_columns())
+
+    def __len__(self):
+        return self.length
+
+# Class that represents an encoded matrix on disk: a memory mapped .npy file with a .json file next to it
+# that holds the column names of every feature, so it can be used without loading it into memory
+class EncodedMatrix(BlockMatrix):
+
+    # Method that is called when the class is initialized
+    def __init__(self, path, mode='r', weights=None):
+        self.path = path
+
+        with open(path + '.json', 'r', encoding='utf-8') as file:
+            meta = json.load(file)
+
+        groups = [(feature, tuple(columns)) for feature, columns in meta['groups']]
+        super().__init__(np.load(path, mmap_mode=mode), meta['columns'], groups, weights, meta.get('binary'))
+
+# Method that makes characters iterable more than once, either from a list or from a function that returns an iterator
+def get_character_iterator(characters):
+
+    if callable(characters):
+        return characters
+
+    return lambda: iter(characters)
+
+# Method that returns the columns of every feature, the number of characters and the names of the trees, in a single pass
+def get_vocabulary(characters, features):
+
+    vocabulary = OrderedDict((feature, set()) for feature in features)
+    trees = set()
+    length = 0
+
+    for char in get_character_iterator(characters)():
+        length += 1
+
+        for feature in features:
+
+            if feature in TALENT_FEATURES:
+                for tree, talents in char[feature].items():
+                    vocabulary[feature].add(tree)
+                    vocabulary[feature].update(talents.keys())
+                    trees.add(tree)
+            else:
+                values = char[feature]
+
+                # Check if values is a list
+                if not isinstance(values, list):
+                    values = [values]
+
+                vocabulary[feature].update(values)
+
+    return OrderedDict((feature, sorted(columns)) for feature, columns in vocabulary.items()), length, trees
+
+# Method that lays out the columns of the features next to each other
+# Returns the column names, the range of columns of every feature, the position of every name per feature
+# and whether every column is binary (trees and single features are, talents aren't)
+def get_layout(vocabulary, trees):
+
+    columns = list()
+    groups = list()
+    column_index = list()
+    binary = list()
+    for feature, feature_columns in vocabulary.items():
+        groups.append((feature, (len(columns), len(columns) + len(feature_columns))))
+        column_index.append({name: len(columns) + i for i, name in enumerate(feature_columns)})
+        columns.extend(feature_columns)
+        binary.extend(feature not in TALENT_FEATURES or name in trees for name in feature_columns)
+
+    return columns, groups, column_index, binary
+
+# Method that encodes a single character into a row of a block
+def fill_row(block, row, char, features, column_index):
+
+    for feature, index in zip(features, column_index):
+
+        if feature in TALENT_FEATURES:
+            for tree, talents in char[feature].items():
+                block[row, index[tree]] = 1
+                for talent, level in talents.items():
+                    block[row, index[talent]] = level
+        else:
+            values = char[feature]
+            if not isinstance(values, list):
+                values = [values]
+            for value in values:
+                block[row, index[value]] = 1
+
+# Method that encodes characters into a BlockMatrix in memory, allocating the matrix once
+def encode_to_memory(characters, features, weights=None, dtype=np.uint8):
+
+    # Check if features is a list
+    if not isinstance(features, list):
+        features = [features]
+
+    vocabulary, length, trees = get_vocabulary(characters, features)
+    columns, groups, column_index, binary = get_layout(vocabulary, trees)
+
+    data = np.zeros((length, len(columns)), dtype=dtype)
+    for row, char in enumerate(get_character_iterator(characters)()):
+        fill_row(data, row, char, features, column_index)
+
+    return BlockMatrix(data, columns, groups, weights, binary)
+
+# Method that encodes characters into the columns of an existing vocabulary (see get_vocabulary), e.g. a new batch
+# for a model that was fitted before. Values that aren't in the vocabulary are left out
+# Returns the BlockMatrix and the number of values that were left out per feature
+def encode_with_vocabulary(characters, features, vocabulary, trees, weights=None, dtype=np.uint8):
+
+    # Check if features is a list
+    if not isinstance(features, list):
+        features = [features]
+
+    columns, groups, column_index, binary = get_layout(OrderedDict((feature, vocabulary[feature]) for feature in features), trees)
+
+    characters = list(get_character_iterator(characters)())
+    unknown = OrderedDict((feature, 0) for feature in features)
+
+    data = np.zeros((len(characters), len(columns)), dtype=dtype)
+    for row, char in enumerate(characters):
+        for feature, index in zip(features, column_index):
+
+            if feature in TALENT_FEATURES:
+                for tree, talents in char[feature].items():
+                    if tree not in index:
+                        unknown[feature] += 1 + len(talents)
+                        continue
+                    data[row, index[tree]] = 1
+                    for talent, level in talents.items():
+                        if talent in index:
+                            data[row, index[talent]] = level
+                        else:
+                            unknown[feature] += 1
+            else:
+                values = char[feature]
+                if not isinstance(values, list):
+                    values = [values]
+                for value in values:
+                    if value in index:
+                        data[row, index[value]] = 1
+                    else:
+                        unknown[feature] += 1
+
+    return BlockMatrix(data, columns, groups, weights, binary), unknown
+
+# Method that encodes characters in chunks to a memory mapped matrix on disk
+# Trees and single features are encoded as 1, talents as their level, so a small integer dtype is enough
+def encode_to_disk(characters, features, path, chunk_size=10000, dtype=np.uint8):
+
+    # Check if features is a list
+    if not isinstance(features, list):
+        features = [features]
+
+    vocabulary, length, trees = get_vocabulary(characters, features)
+    columns, groups, column_index, binary = get_layout(vocabulary, trees)
+
+    with open(path + '.json', 'w', encoding='utf-8') as file:
+        json.dump({'groups': groups, 'columns': columns, 'binary': binary}, file)
+
+    data = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(length, len(columns)))
+
+    print(f'Encoding {length} characters into {len(columns)} columns...')
+
+    # Fill the matrix one chunk at a time
+    block = np.zeros((chunk_size, len(columns)), dtype=dtype)
+    row = 0
+    start = 0
+    for char in get_character_iterator(characters)():
+
+        fill_row(block, row, char, features, column_index)
+
+        row += 1
+
+        if row == chunk_size:
+            data[start:start + row] = block
+            start += row
+            row = 0
+            block[:] = 0
+
+    data[start:start + row] = block[:row]
+    data.flush()
+    del data
+
+    return EncodedMatrix(path)
+
+# Method that returns the mean of every column, reading the matrix in chunks
+def get_column_means(matrix, chunk_size=10000, weights=None):
+
+    totals = np.zeros(matrix.shape[1], dtype=np.float64)
+    for _, chunk in matrix.iter_chunks(chunk_size, weights):
+        totals += chunk.sum(axis=0)
+
+    return pd.Series(totals / max(len(matrix), 1), index=matrix.get_unique_columns())
+
+# Method that returns in how many rows every column is not zero, reading the matrix in chunks
+def get_column_counts(matrix, chunk_size=10000):
+
+    counts = np.zeros(matrix.shape[1], dtype=np.int64)
+    for start in range(0, len(matrix), chunk_size):
+        counts += np.count_nonzero(matrix.data[start:start + chunk_size], axis=0)
+
+    return pd.Series(counts, index=matrix.get_unique_columns())
+
+# Method that returns a cluster model that is fitted one chunk at a time
+def get_cluster_model(matrix, num_clusters, model=None, chunk_size=10000, weights=None, epochs=3):
+    from sklearn.cluster import MiniBatchKMeans
+
+    if model == None:
+        model = MiniBatchKMeans(n_clusters=num_clusters, batch_size=min(chunk_size, 4096), n_init=3)
+
+    for _ in range(epochs):
+        for _, chunk in matrix.iter_chunks(chunk_size, weights):
+            # The first call needs at least as many rows as clusters
+            if not hasattr(model, 'cluster_centers_') and len(chunk) < model.n_clusters:
+                continue
+            model.partial_fit(chunk)
+
+    return model
+
+# Method that returns the cluster label of every row, predicted one chunk at a time
+def get_cluster_labels(matrix, model, chunk_size=10000, weights=None):
+
+    labels = np.zeros(len(matrix), dtype=np.int32)
+    for start, chunk in matrix.iter_chunks(chunk_size, weights):
+        labels[start:start + len(chunk)] = model.predict(chunk)
+
+    return labels
+
+# Method that returns cluster centers and the closest observations, reading the matrix in chunks
+def get_cluster_centers_and_observations_closest(matrix, num_clusters, model=None, chunk_size=10000, weights=None):
+    from sklearn.metrics import pairwise_distances_argmin_min
+
+    model = get_cluster_model(matrix, num_clusters, model, chunk_size, weights)
+    labels = get_cluster_labels(matrix, model, chunk_size, weights)
+
+    # Calculate the cluster centers (means)
+    sums = np.zeros((num_clusters, matrix.shape[1]), dtype=np.float64)
+    for start, chunk in matrix.iter_chunks(chunk_size, weights):
+        np.add.at(sums, labels[start:start + len(chunk)], chunk)
+
+    sizes = np.bincount(labels, minlength=num_clusters)
+    centers = sums / np.maximum(sizes, 1)[:, None]
+
+    # Find the closest data point to each cluster center
+    closest_indices = np.zeros(num_clusters, dtype=np.int64)
+    closest_distances = np.full(num_clusters, np.inf)
+    for start, chunk in matrix.iter_chunks(chunk_size, weights):
+        indices, distances = pairwise_distances_argmin_min(centers, chunk)
+        better = distances < closest_distances
+        closest_indices[better] = start + indices[better]
+        closest_distances[better] = distances[better]
+
+    columns = matrix.get_unique_columns()
+    cluster_centers = [pd.Series(center, index=columns) for center in centers]
+    closest_points = [matrix.get_row(index, weights) for index in closest_indices]
+
+    return cluster_centers, closest_points
@@ -0,0 +1,159 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import matrix
+
+# sklearn is imported in the methods that use it, it takes long to load
+
+# Class that keeps a clustering up to date while new characters come in, without refitting on all characters
+# The columns (vocabulary) are fixed by the first batch, or given, so the model keeps the same shape: every new batch
+# is encoded into those columns and updates the centers with a partial fit (MiniBatchKMeans), in time proportional to the batch.
+# Values that appear later and aren't in the vocabulary are counted per batch, if there are many it's time to start over
+class OnlineClustering:
+
+    # Method that is called when the class is initialized
+    def __init__(self, features, num_clusters, weights=None, vocabulary=None, trees=None, batch_size=1024, random_state=None):
+
+        # Check if features is a list
+        if not isinstance(features, list):
+            features = [features]
+
+        # Check if features and weights are the same length
+        if weights != None and len(features) != len(weights):
+            raise Exception("The features and weights are different lengths")
+
+        self.features = features
+        self.num_clusters = num_clusters
+        self.weights = weights
+        self.vocabulary = vocabulary
+        self.trees = trees if trees is not None else set()
+        self.batch_size = batch_size
+        self.random_state = random_state
+
+        self.model = None
+        self.columns = None
+        self.names = None # the raw column names, see matrix.BlockMatrix.get_unique_columns
+        self.groups = None
+        self.column_weights = None
+        self.pending = list() # characters that arrived before there were enough to start the model
+        self.labels = np.zeros(0, dtype=np.int32) # the cluster of every character when it arrived
+        self.sizes = np.zeros(num_clusters, dtype=np.int64)
+        self.history = list()
+
+    # Method that encodes characters into the weighted columns of the model
+    def encode(self, characters):
+
+        block_matrix, unknown = matrix.encode_with_vocabulary(characters, self.features, self.vocabulary, self.trees, self.weights)
+
+        if self.columns is None:
+            self.columns = block_matrix.get_unique_columns()
+            self.names = block_matrix.columns
+            self.groups = block_matrix.groups
+            self.column_weights = block_matrix.get_column_weights()
+
+        return block_matrix.data.astype(np.float32) * self.column_weights, unknown
+
+    # Method that adds a batch of characters: updates the centers and returns the clusters of the batch
+    # Returns None while there are fewer characters than clusters, those are used as soon as there are enough
+    def update(self, characters):
+        from sklearn.cluster import MiniBatchKMeans
+
+        characters = self.pending + list(characters)
+
+        if self.model is None:
+            if len(characters) < self.num_clusters:
+                self.pending = characters
+                return None
+
+            self.pending = list()
+
+            if self.vocabulary is None:
+                self.vocabulary, _, self.trees = matrix.get_vocabulary(characters, self.features)
+
+            self.model = MiniBatchKMeans(n_clusters=self.num_clusters, batch_size=self.batch_size, n_init=3, random_state=self.random_state)
+
+        if len(characters) == 0:
+            return np.zeros(0, dtype=np.int32)
+
+        X, unknown = self.encode(characters)
+        previous_centers = self.model.cluster_centers_.copy() if hasattr(self.model, 'cluster_centers_') else None
+
+        self.model.partial_fit(X)
+        labels = self.model.predict(X).astype(np.int32)
+
+        # Keep track of how the clusters change
+        batch_sizes = np.bincount(labels, minlength=self.num_clusters)
+        previous_shares = self.sizes / self.sizes.sum() if self.sizes.sum() > 0 else None
+        self.sizes += batch_sizes
+        self.labels = np.concatenate([self.labels, labels])
+
+        self.history.append({'batch': len(self.history) + 1,
+                             'characters': len(characters),
+                             'sizes': batch_sizes,
+                             'total sizes': self.sizes.copy(),
+                             # Half the summed difference between the shares of the batch and of everything before it (0 to 1)
+                             'size drift': None if previous_shares is None else 0.5 * np.abs(batch_sizes / len(characters) - previous_shares).sum(),
+                             # How far the centers moved, on average
+                             'center shift': None if previous_centers is None else np.linalg.norm(self.model.cluster_centers_ - previous_centers, axis=1).mean(),
+                             'unknown values': sum(unknown.values())})
+
+        return labels
+
+    # Method that adds characters in batches of batch_size, e.g. a whole list, returns the clusters of all of them
+    def update_in_batches(self, characters):
+
+        characters = list(characters)
+        labels = [self.update(characters[start:start + self.batch_size]) for start in range(0, len(characters), self.batch_size)]
+        labels = [batch_labels for batch_labels in labels if batch_labels is not None]
+
+        return np.concatenate(labels) if labels else np.zeros(0, dtype=np.int32)
+
+    # Method that returns the clusters of characters with the current centers, without updating them
+    def predict(self, characters):
+
+        if self.model is None:
+            raise Exception("The model hasn't seen enough characters yet")
+
+        return self.model.predict(self.encode(characters)[0]).astype(np.int32)
+
+    # Method that returns the current cluster centers as a DataFrame, one row per cluster
+    # Use methods.get_converted_means(charList, centers, groups=self.groups, names=self.names) to turn them into builds
+    def get_centers(self):
+
+        if self.model is None:
+            raise Exception("The model hasn't seen enough characters yet")
+
+        return pd.DataFrame(self.model.cluster_centers_, columns=self.columns)
+
+    # Method that returns the history of the updates as a DataFrame: per batch the share of every cluster,
+    # the size drift, the center shift and the number of values that weren't in the vocabulary
+    def get_drift(self):
+
+        rows = list()
+        for entry in self.history:
+            row = OrderedDict([('batch', entry['batch']), ('characters', entry['characters'])])
+            for cluster, size in enumerate(entry['sizes']):
+                row[f'cluster {cluster + 1}'] = size / entry['characters']
+            row['size drift'] = entry['size drift']
+            row['center shift'] = entry['center shift']
+            row['unknown values'] = entry['unknown values']
+            rows.append(row)
+
+        return pd.DataFrame(rows)
+
+    # Method that prints the total size of every cluster and how much the last batches changed them
+    def print_drift(self, num=5):
+
+        total = max(self.sizes.sum(), 1)
+        print(f"{self.sizes.sum()} characters in {len(self.history)} batches")
+        for cluster, size in enumerate(self.sizes):
+            print(f"\tCluster {cluster + 1}: {size} ({size / total:.1%})")
+
+        print(f"Last {num} batches:")
+        for entry in self.history[-num:]:
+            shares = ', '.join(f'{size / entry["characters"]:.0%}' for size in entry['sizes'])
+            drift = '-' if entry['size drift'] is None else f"{entry['size drift']:.3f}"
+            shift = '-' if entry['center shift'] is None else f"{entry['center shift']:.3f}"
+            print(f"\tBatch {entry['batch']}: {entry['characters']} characters [{shares}], size drift {drift}, center shift {shift}, {entry['unknown values']} unknown values")
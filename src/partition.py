@@ -0,0 +1,117 @@
+import multiprocessing
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import classes
+import methods
+
+# The characters every worker process analyses partitions of, set once per process by set_shared_characters
+# (inherited without copying where processes are forked), so a task only sends the rows of its partition
+SHARED_CHARACTERS = None
+
+# Method that sets the characters of a worker process
+def set_shared_characters(char_list):
+    global SHARED_CHARACTERS
+    SHARED_CHARACTERS = char_list
+
+# Method that splits characters by the values of one or more fields, e.g. ['class', 'version']
+# Returns a dictionary of (value, ...) -> rows, largest partition first
+def split_characters(char_list, fields):
+
+    # Check if fields is a list
+    if not isinstance(fields, list):
+        fields = [fields]
+
+    partitions = OrderedDict()
+    for row, char in enumerate(char_list):
+        key = tuple(tuple(char[field]) if isinstance(char[field], list) else char[field] for field in fields)
+        partitions.setdefault(key, []).append(row)
+
+    return OrderedDict(sorted(partitions.items(), key=lambda item: len(item[1]), reverse=True))
+
+# Method that encodes, clusters and converts the cluster centers of a partition into builds
+# Returns a dictionary with the rows of the partition, the number of characters per cluster, the builds, the closest observations
+# and the groups and raw column names of the encoded matrix
+def analyse_partition(args):
+    from sklearn.cluster import AgglomerativeClustering
+
+    key, rows, features, num_clusters, weights, metric = args
+
+    charList = classes.CharacterList([SHARED_CHARACTERS[row] for row in rows], deep_copy=False)
+
+    block_matrix = charList.get_block_matrix(features, weights)
+    df = block_matrix.to_df()
+
+    if metric:
+        distances = charList.get_binary_distances(features, metric, block_matrix)
+        model = AgglomerativeClustering(n_clusters=num_clusters, metric='precomputed', linkage='average')
+    else:
+        distances = None
+        model = AgglomerativeClustering(n_clusters=num_clusters)
+
+    centers, closest = methods.get_cluster_centers_and_observations_closest(df, model=model, num_clusters=num_clusters, distances=distances)
+    builds = methods.get_converted_means(charList, centers, groups=block_matrix.groups, names=block_matrix.columns)
+
+    return {'key': key,
+            'rows': rows,
+            'sizes': np.bincount(model.labels_, minlength=num_clusters),
+            'builds': builds,
+            'groups': block_matrix.groups,
+            'names': block_matrix.columns,
+            'closest': closest}
+
+# Method that analyses every partition of a character list (classes.CharacterList) on a pool of processes
+# Partitions with fewer characters than min_size (or than clusters) are left out
+# The largest partitions are started first, so the whole analysis takes about as long as the largest one
+# Returns a dictionary of partition -> result of analyse_partition
+def analyse_partitions(charList, fields, features, num_clusters, weights=None, metric=None, processes=None, min_size=None):
+
+    # Check if features is a list
+    if not isinstance(features, list):
+        features = [features]
+
+    min_size = max(min_size or 0, num_clusters)
+
+    partitions = split_characters(charList.char_list, fields)
+    tasks = [(key, rows, features, num_clusters, weights, metric) for key, rows in partitions.items() if len(rows) >= min_size]
+
+    print(f'Analysing {len(tasks)} of {len(partitions)} partitions...')
+
+    results = OrderedDict()
+    with multiprocessing.Pool(processes, initializer=set_shared_characters, initargs=(charList.char_list,)) as pool:
+        for result in pool.imap_unordered(analyse_partition, tasks):
+            print(f"Finished {', '.join(map(str, result['key']))} ({len(result['rows'])} characters)")
+            results[result['key']] = result
+
+    # Same order as the partitions
+    return OrderedDict((task[0], results[task[0]]) for task in tasks)
+
+# Method that puts the builds of all partitions in one DataFrame, one row per (partition, cluster)
+# Columns that a partition doesn't have are 0
+def get_report_df(results):
+
+    frames = list()
+    for key, result in results.items():
+        builds = result['builds'].copy()
+        builds.insert(0, 'characters', result['sizes'])
+        builds.index = pd.MultiIndex.from_tuples([(key, cluster + 1) for cluster in range(len(builds))], names=['partition', 'cluster'])
+        frames.append(builds)
+
+    if not frames:
+        return pd.DataFrame()
+
+    return pd.concat(frames).fillna(0)
+
+# Method that prints the builds of every partition
+def print_report(charList, results):
+
+    for key, result in results.items():
+        partition = classes.CharacterList([charList.char_list[row] for row in result['rows']], deep_copy=False)
+
+        print(f"### {', '.join(map(str, key))} ({len(result['rows'])} characters)")
+        for cluster, (_, build) in enumerate(result['builds'].iterrows()):
+            print(f"Cluster {cluster + 1} ({result['sizes'][cluster]} characters)")
+            methods.print_closest_observation(partition, build, result['groups'], result['names'])
+            print()
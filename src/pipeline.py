@@ -0,0 +1,196 @@
+import argparse
+import dataclasses
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+
+import classes
+import methods
+
+# Change this when a stage starts giving different results for the same inputs, so old artifacts aren't used
+PIPELINE_VERSION = 2
+
+# Method that returns the sha256 of json serializable data
+def get_json_hash(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+# Class that runs the analysis from scraping to builds in stages, and caches the result (artifact) of every stage
+#
+# Stages: scrape (or the given characters) -> clean -> encode -> cluster -> builds
+# Every artifact is pickled to <cache_dir>/artifacts/<sha256 of its content>.pkl. A stage is identified by its
+# parameters and the content hashes of its inputs, and <cache_dir>/<stage>-<hash of those>.json points to its artifact.
+# A stage whose inputs and parameters didn't change is skipped, and its artifact is only loaded when a later stage needs it
+class Pipeline:
+
+    # Method that is called when the class is initialized
+    # Give either a classes.CharFilter to scrape, or a classes.CharacterList that was scraped before
+    def __init__(self, cache_dir, char_filter=None, characters=None):
+
+        if (char_filter is None) == (characters is None):
+            raise Exception("Give either a char_filter or characters")
+
+        self.cache_dir = cache_dir
+        self.char_filter = char_filter
+        self.characters = characters
+        self.loaded = {} # content hash -> artifact
+        self.stages_run = list()
+
+        os.makedirs(os.path.join(cache_dir, 'artifacts'), exist_ok=True)
+
+    # Method that stores an artifact under its content hash and returns the hash
+    def store(self, artifact):
+
+        data = pickle.dumps(artifact, protocol=pickle.HIGHEST_PROTOCOL)
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.cache_dir, 'artifacts', f'{content_hash}.pkl')
+
+        # Write to a temporary file first, so a crash never leaves half an artifact
+        if not os.path.exists(path):
+            with open(path + '.tmp', 'wb') as file:
+                file.write(data)
+            os.replace(path + '.tmp', path)
+
+        self.loaded[content_hash] = artifact
+        return content_hash
+
+    # Method that returns the artifact with a content hash, loading it from disk only once
+    def load(self, content_hash):
+
+        if content_hash not in self.loaded:
+            with open(os.path.join(self.cache_dir, 'artifacts', f'{content_hash}.pkl'), 'rb') as file:
+                self.loaded[content_hash] = pickle.load(file)
+
+        return self.loaded[content_hash]
+
+    # Method that runs a stage, or finds its artifact in the cache, and returns the content hash of its artifact
+    # function gets the loaded artifacts of the inputs (content hashes) and returns the artifact of the stage
+    def run_stage(self, name, params, inputs, function):
+
+        key = get_json_hash({'stage': name, 'version': PIPELINE_VERSION, 'params': params, 'inputs': inputs})
+        index_path = os.path.join(self.cache_dir, f'{name}-{key}.json')
+
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as file:
+                content_hash = json.load(file)['artifact']
+
+            if os.path.exists(os.path.join(self.cache_dir, 'artifacts', f'{content_hash}.pkl')):
+                print(f'Skipping {name}, its inputs and parameters did not change')
+                return content_hash
+
+        print(f'Running {name}...')
+        artifact = function(*[self.load(content_hash) for content_hash in inputs])
+        content_hash = self.store(artifact)
+
+        with open(index_path, 'w', encoding='utf-8') as file:
+            json.dump({'stage': name, 'params': params, 'inputs': inputs, 'artifact': content_hash}, file)
+
+        self.stages_run.append(name)
+        return content_hash
+
+    # Method that runs all the stages and returns the artifacts of the last four
+    # model is 'agglomerative' or 'two stage' (see methods.TwoStageClustering), metric 'jaccard' or 'hamming' clusters
+    # on the binary features (see bitpack) instead
+    def run(self, features, num_clusters, weights=None, model='agglomerative', metric=None, num_micro_clusters=500):
+
+        self.stages_run = list()
+
+        # Check if features is a list
+        if not isinstance(features, list):
+            features = [features]
+
+        ## Scrape, or start from the given characters
+        if self.char_filter is not None:
+            scraped = self.run_stage('scrape', dataclasses.asdict(self.char_filter), [],
+                                     lambda: self.char_filter.get_characters())
+        else:
+            scraped = self.store(self.characters)
+
+        ## Clean
+        def clean(characters):
+            cleaned = classes.CharacterList(characters.char_list, deep_copy=False)
+            cleaned.clean_characters()
+            return cleaned
+
+        cleaned = self.run_stage('clean', {}, [scraped], clean)
+
+        ## Encode
+        encoded = self.run_stage('encode', {'features': features, 'weights': weights}, [cleaned],
+                                 lambda characters: characters.get_block_matrix(features, weights))
+
+        ## Cluster
+        def cluster(block_matrix):
+            import bitpack
+
+            df = block_matrix.to_df()
+
+            # The binary distances come from the encoded matrix, so the characters aren't encoded again
+            distances = bitpack.pairwise_distances(bitpack.pack_block_matrix(block_matrix), metric=metric) if metric else None
+
+            if model == 'two stage':
+                if metric:
+                    raise Exception("The two stage model clusters the encoded features, it can't use a metric")
+                cluster_model = methods.TwoStageClustering(num_clusters, num_micro_clusters)
+            elif model == 'agglomerative':
+                from sklearn.cluster import AgglomerativeClustering
+                if metric:
+                    cluster_model = AgglomerativeClustering(n_clusters=num_clusters, metric='precomputed', linkage='average')
+                else:
+                    cluster_model = AgglomerativeClustering(n_clusters=num_clusters)
+            else:
+                raise Exception(f"{model} is not a valid model, choose from ['agglomerative', 'two stage']")
+
+            # The model is fitted by get_cluster_centers_and_observations_closest, its labels give the cluster sizes
+            centers, closest = methods.get_cluster_centers_and_observations_closest(df, model=cluster_model, num_clusters=num_clusters, distances=distances)
+            return {'labels': cluster_model.labels_, 'centers': centers, 'closest': closest}
+
+        cluster_params = {'num_clusters': num_clusters, 'model': model, 'metric': metric,
+                          'num_micro_clusters': num_micro_clusters if model == 'two stage' else None}
+        clustered = self.run_stage('cluster', cluster_params, [encoded], cluster)
+
+        ## Builds
+        def builds(characters, block_matrix, clusters):
+            return methods.get_converted_means(characters, clusters['centers'], groups=block_matrix.groups, names=block_matrix.columns)
+
+        built = self.run_stage('builds', {}, [cleaned, encoded, clustered], builds)
+
+        return {'characters': self.load(cleaned), 'matrix': self.load(encoded), 'clusters': self.load(clustered), 'builds': self.load(built)}
+
+# Method that prints the result of Pipeline.run: the size and the build of every cluster
+def print_report(result):
+
+    sizes = np.bincount(result['clusters']['labels'], minlength=len(result['builds']))
+
+    for cluster, (_, build) in enumerate(result['builds'].iterrows()):
+        print(f"Cluster {cluster + 1} ({sizes[cluster]} characters)")
+        methods.print_closest_observation(result['characters'], build, result['matrix'].groups, result['matrix'].columns)
+        print()
+
+# Run the pipeline from the command line, e.g.
+# python pipeline.py cache --char_class Wyrmic --winner --features race prodigies --weights 1 5 --clusters 5
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scrape, cluster and print the builds of the characters in the vault')
+    parser.add_argument('cache_dir')
+    parser.add_argument('--characters', help='pickled CharacterList to use instead of scraping')
+    parser.add_argument('--features', nargs='+', default=['race', 'class talents', 'generic talents', 'prodigies'])
+    parser.add_argument('--weights', nargs='+', type=float)
+    parser.add_argument('--clusters', type=int, default=5)
+    parser.add_argument('--model', default='agglomerative', choices=['agglomerative', 'two stage'])
+    parser.add_argument('--metric', choices=['jaccard', 'hamming'])
+    for field in dataclasses.fields(classes.CharFilter):
+        if field.type in [bool, 'bool']:
+            parser.add_argument(f'--{field.name}', action='store_true')
+        else:
+            parser.add_argument(f'--{field.name}', type=int if field.type in [int, 'int'] else str, default=field.default)
+    args = parser.parse_args()
+
+    if args.characters:
+        with open(args.characters, 'rb') as file:
+            pipeline = Pipeline(args.cache_dir, characters=pickle.load(file))
+    else:
+        char_filter = classes.CharFilter(**{field.name: getattr(args, field.name) for field in dataclasses.fields(classes.CharFilter)})
+        pipeline = Pipeline(args.cache_dir, char_filter=char_filter)
+
+    print_report(pipeline.run(args.features, args.clusters, args.weights, args.model, args.metric))
@@ -0,0 +1,135 @@
+import numpy as np
+
+# Fields that have a single value per character, a list of values in a query matches any of them
+SINGLE_FIELDS = ['race', 'class', 'version', 'difficulty', 'permadeath']
+
+# Fields that have several values per character, a list of values in a query must all be present
+MULTI_FIELDS = ['prodigies', 'inscriptions', 'trees']
+
+# Method that turns row numbers (or a boolean mask) into a bitmap, stored as a python integer with bit i for row i
+def to_bitmap(rows, length):
+
+    mask = np.zeros(length, dtype=bool)
+    mask[rows] = True
+
+    return int.from_bytes(np.packbits(mask, bitorder='little').tobytes(), 'little')
+
+# Method that turns a bitmap back into an array of row numbers
+def to_rows(bitmap, length):
+
+    packed = np.frombuffer(bitmap.to_bytes((length + 7) // 8, 'little'), dtype=np.uint8)
+
+    return np.flatnonzero(np.unpackbits(packed, bitorder='little')[:length])
+
+# Method that wraps a single value in a list
+def as_list(values):
+
+    if not isinstance(values, (list, set, tuple)):
+        return [values]
+
+    return values
+
+# Class that holds bitmap indexes of a list of characters, so combined filters are a few bitwise operations
+class CharacterIndex:
+
+    # Method that is called when the class is initialized
+    def __init__(self, char_list):
+        self.length = len(char_list)
+        self.all = (1 << self.length) - 1
+
+        # Collect the rows of every (field, value) and the levels of every talent in a single pass
+        rows = {}
+        talent_rows = {} # talent -> level -> rows
+        levels = np.full(self.length, -1, dtype=np.int64)
+
+        for index, char in enumerate(char_list):
+
+            for field in SINGLE_FIELDS:
+                rows.setdefault((field, char[field]), []).append(index)
+
+            for field in ['prodigies', 'inscriptions']:
+                for value in char[field]:
+                    rows.setdefault((field, value), []).append(index)
+
+            for type in ['class talents', 'generic talents']:
+                for tree, talents_dict in char[type].items():
+                    rows.setdefault(('trees', tree), []).append(index)
+
+                    for talent, level in talents_dict.items():
+                        if level > 0:
+                            talent_rows.setdefault(talent, {}).setdefault(level, []).append(index)
+
+            try:
+                levels[index] = int(char['level'])
+            except (KeyError, TypeError, ValueError):
+                pass
+
+        self.levels = levels
+        self.bitmaps = {key: to_bitmap(key_rows, self.length) for key, key_rows in rows.items()}
+
+        # For every talent a bitmap of the rows with at least level 1, 2, ...
+        self.talent_bitmaps = {}
+        for talent, level_rows in talent_rows.items():
+            bitmaps = list()
+            at_least = 0
+            for level in range(max(level_rows), 0, -1):
+                at_least |= to_bitmap(level_rows.get(level, []), self.length)
+                bitmaps.append(at_least)
+            self.talent_bitmaps[talent] = bitmaps[::-1]
+
+    # Method that returns the bitmap of the rows that have a talent of at least a level
+    def get_talent_bitmap(self, talent, min_level=1):
+
+        bitmaps = self.talent_bitmaps.get(talent, [])
+
+        if min_level <= 0:
+            return self.all
+        if min_level > len(bitmaps):
+            return 0
+
+        return bitmaps[min_level - 1]
+
+    # Method that returns the bitmap of the rows that match all the given filters
+    # race, char_class, version, difficulty and permadeath match any of the values in a list,
+    # prodigy, inscription and tree must all be present, talents is a dictionary of talent -> minimum level
+    def get_bitmap(self, race=None, char_class=None, version=None, difficulty=None, permadeath=None,
+                   min_level=None, max_level=None, prodigy=None, inscription=None, tree=None, talents=None):
+
+        bitmap = self.all
+
+        for field, values in zip(SINGLE_FIELDS, [race, char_class, version, difficulty, permadeath]):
+            if values is None:
+                continue
+
+            union = 0
+            for value in as_list(values):
+                union |= self.bitmaps.get((field, value), 0)
+            bitmap &= union
+
+        for field, values in zip(MULTI_FIELDS, [prodigy, inscription, tree]):
+            if values is None:
+                continue
+
+            for value in as_list(values):
+                bitmap &= self.bitmaps.get((field, value), 0)
+
+        if min_level is not None or max_level is not None:
+            mask = np.ones(self.length, dtype=bool)
+            if min_level is not None:
+                mask &= self.levels >= int(min_level)
+            if max_level is not None:
+                mask &= (self.levels <= int(max_level)) & (self.levels >= 0)
+            bitmap &= to_bitmap(mask, self.length)
+
+        for talent, talent_level in (talents or {}).items():
+            bitmap &= self.get_talent_bitmap(talent, talent_level)
+
+        return bitmap
+
+    # Method that returns the row numbers that match all the given filters, see get_bitmap
+    def query(self, **filters):
+        return to_rows(self.get_bitmap(**filters), self.length)
+
+    # Method that returns the number of rows that match all the given filters, see get_bitmap
+    def count(self, **filters):
+        return bin(self.get_bitmap(**filters)).count('1')
@@ -0,0 +1,254 @@
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+import methods
+
+# Class that describes the work queue that scraper workers share
+# A task is a listing page ('page') or a character url ('character'), identified by its url (the key).
+# Workers claim a task for a while (a lease) and acknowledge it with its result; a task whose lease runs out
+# without an acknowledgement can be claimed by another worker. Subclasses implement the storage,
+# SQLiteWorkQueue for workers on one machine, or e.g. a networked database for several hosts
+class WorkQueue(ABC):
+
+    # Method that adds a task, returns False if a task with the same key was already added
+    @abstractmethod
+    def put(self, kind, key, payload=None):
+        raise NotImplementedError
+
+    # Method that claims a pending (or expired) task for a worker, returns (task id, kind, key, payload, attempts) or None
+    @abstractmethod
+    def claim(self, worker, lease_seconds=300):
+        raise NotImplementedError
+
+    # Method that finishes a claimed task and stores its result, only once per key
+    # Returns False if the worker lost its lease and another worker finished the task
+    @abstractmethod
+    def ack(self, task_id, worker, result=None):
+        raise NotImplementedError
+
+    # Method that gives a claimed task back, e.g. after an error, so another worker can claim it
+    @abstractmethod
+    def release(self, task_id, worker):
+        raise NotImplementedError
+
+    # Method that returns the number of tasks per state ('pending', 'leased', 'done'), for one kind or all tasks
+    @abstractmethod
+    def counts(self, kind=None):
+        raise NotImplementedError
+
+    # Method that returns the results of the finished tasks of a kind, as a dictionary of key -> result
+    @abstractmethod
+    def get_results(self, kind):
+        raise NotImplementedError
+
+    # Method that returns the extracted characters, leaving out the rejected ones
+    def get_characters(self):
+        return [char for char in self.get_results('character').values() if char is not None]
+
+# Class that implements the work queue in a SQLite database, shared by worker processes on the same machine
+class SQLiteWorkQueue(WorkQueue):
+
+    # Method that is called when the class is initialized
+    def __init__(self, path):
+        self.path = path
+
+        # Autocommit mode, transactions are started explicitly
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS tasks (
+                                       id INTEGER PRIMARY KEY,
+                                       kind TEXT NOT NULL,
+                                       key TEXT NOT NULL UNIQUE,
+                                       payload TEXT,
+                                       state TEXT NOT NULL DEFAULT 'pending',
+                                       owner TEXT,
+                                       lease_expires REAL,
+                                       attempts INTEGER NOT NULL DEFAULT 0)''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, lease_expires)')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS results (
+                                       key TEXT PRIMARY KEY,
+                                       kind TEXT NOT NULL,
+                                       result TEXT)''')
+
+    def put(self, kind, key, payload=None):
+        cursor = self.connection.execute('INSERT OR IGNORE INTO tasks (kind, key, payload) VALUES (?, ?, ?)',
+                                         (kind, key, json.dumps(payload)))
+        return cursor.rowcount == 1
+
+    def claim(self, worker, lease_seconds=300):
+
+        now = time.time()
+
+        # Take the write lock first, so two workers can't claim the same task
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.connection.execute('''SELECT id, kind, key, payload, attempts FROM tasks
+                                             WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?)
+                                             ORDER BY id LIMIT 1''', (now,)).fetchone()
+            if row is not None:
+                self.connection.execute('''UPDATE tasks SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1
+                                           WHERE id = ?''', (worker, now + lease_seconds, row[0]))
+            self.connection.execute('COMMIT')
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+
+        if row is None:
+            return None
+
+        return row[0], row[1], row[2], json.loads(row[3]), row[4] + 1
+
+    def ack(self, task_id, worker, result=None):
+
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.connection.execute('SELECT kind, key, state FROM tasks WHERE id = ?', (task_id,)).fetchone()
+
+            # Someone else finished it after our lease ran out
+            if row is None or row[2] == 'done':
+                self.connection.execute('COMMIT')
+                return False
+
+            self.connection.execute('INSERT OR IGNORE INTO results (key, kind, result) VALUES (?, ?, ?)',
+                                    (row[1], row[0], json.dumps(result)))
+            self.connection.execute("UPDATE tasks SET state = 'done', owner = ?, lease_expires = NULL WHERE id = ?",
+                                    (worker, task_id))
+            self.connection.execute('COMMIT')
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+
+        return True
+
+    def release(self, task_id, worker):
+        self.connection.execute('''UPDATE tasks SET state = 'pending', owner = NULL, lease_expires = NULL
+                                   WHERE id = ? AND owner = ? AND state = 'leased' ''', (task_id, worker))
+
+    def counts(self, kind=None):
+
+        if kind is None:
+            rows = self.connection.execute('SELECT state, COUNT(*) FROM tasks GROUP BY state').fetchall()
+        else:
+            rows = self.connection.execute('SELECT state, COUNT(*) FROM tasks WHERE kind = ? GROUP BY state', (kind,)).fetchall()
+
+        counts = {'pending': 0, 'leased': 0, 'done': 0}
+        counts.update(dict(rows))
+        return counts
+
+    def get_results(self, kind):
+        rows = self.connection.execute('SELECT key, result FROM results WHERE kind = ? ORDER BY rowid', (kind,))
+        return OrderedDict((key, json.loads(result, object_pairs_hook=OrderedDict)) for key, result in rows)
+
+    def close(self):
+        self.connection.close()
+
+# Method that puts the first listing page of a filter (classes.CharFilter) in the queue
+def seed(queue, char_filter):
+
+    base_url = char_filter.create_url()
+    queue.put('page', f"{base_url}&page=0", {'base_url': base_url, 'page': 0, 'max_urls': char_filter.max_urls})
+
+# Method that handles a listing page: its character urls become tasks, and so does the next page if more are needed
+def process_page(queue, payload, page_url):
+
+    page_urls, empty = methods.get_listing_page(page_url)
+
+    if empty:
+        print(f"Page {payload['page']} is empty. Ending...")
+        return {'urls': 0}
+
+    for url in page_urls:
+        queue.put('character', url)
+
+    total = sum(queue.counts('character').values())
+    if total <= payload['max_urls']:
+        next_page = payload['page'] + 1
+        queue.put('page', f"{payload['base_url']}&page={next_page}", {**payload, 'page': next_page})
+
+    return {'urls': len(page_urls)}
+
+# Method that extracts a character, returns None for characters that are filtered out (or can't be parsed)
+def process_character(url):
+
+    # A failed download raises, so the task is released and tried again
+    char = methods.get_character_dictionary(url)
+
+    # Filter out non-english characters
+    if char['class talents'] == OrderedDict() or char['generic talents'] == OrderedDict():
+        return None
+
+    return char
+
+# Method that keeps claiming and finishing tasks until the queue is done
+# Any number of workers (processes or hosts sharing the queue) can run this at the same time
+# A task that fails max_attempts times is finished without a result
+def run_worker(queue, worker=None, lease_seconds=300, poll_seconds=5, max_attempts=5):
+
+    if worker is None:
+        worker = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+    finished = 0
+    while True:
+        task = queue.claim(worker, lease_seconds)
+
+        if task is None:
+            counts = queue.counts()
+
+            # Nothing left at all
+            if counts['pending'] == 0 and counts['leased'] == 0:
+                break
+
+            # Other workers may still add tasks, or their leases may run out
+            time.sleep(poll_seconds)
+            continue
+
+        task_id, kind, key, payload, attempts = task
+        try:
+            if kind == 'page':
+                result = process_page(queue, payload, key)
+            else:
+                result = process_character(key)
+        except Exception as e:
+            print(f'Something went wrong with {key} (attempt {attempts})')
+            print(e)
+            
+            if attempts < max_attempts:
+                queue.release(task_id, worker)
+                continue
+            result = None
+
+        if queue.ack(task_id, worker, result):
+            finished += 1
+
+    print(f'Worker {worker} finished {finished} tasks')
+    return finished
+
+# Method that runs a worker on a SQLite queue, every process needs its own connection
+def run_sqlite_worker(path):
+    queue = SQLiteWorkQueue(path)
+    try:
+        return run_worker(queue)
+    finally:
+        queue.close()
+
+# Method that runs a number of worker processes on a SQLite queue and waits for them
+def run_sqlite_workers(path, num_workers=4):
+
+    processes = [multiprocessing.Process(target=run_sqlite_worker, args=(path,)) for _ in range(num_workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+# Run a worker from the command line: python work_queue.py <queue.db>
+if __name__ == '__main__':
+    run_sqlite_worker(sys.argv[1])